@@ -1,93 +1,65 @@
 import asyncio
 import configparser
-import functools
 import logging
 import os
 from optparse import OptionParser
 
 from pycec import DEFAULT_PORT, DEFAULT_HOST
-from pycec.cec import CecAdapter
-from pycec.commands import CecCommand, PollCommand
+from pycec.server import CecServer, DEFAULT_QUEUE_SIZE, \
+    DEFAULT_SLOW_CLIENT_POLICY, DEFAULT_MAX_AGE, DEFAULT_POLL_REUSE, \
+    DEFAULT_HISTORY_SIZE, POLICY_DROP, POLICY_DISCONNECT
 from . import _LOGGER
 from .network import HDMINetwork
 
+DEFAULT_ADAPTER_PORT_CACHE = os.path.expanduser('~/.pycec-adapter')
 
-async def async_show_devices(network, loop):
+
+async def async_show_devices(network, loop, server=None):
     while True:
         for d in network.devices:
             _LOGGER.debug("Present device %s", d)
+        if server:
+            server.log_stats()
         await asyncio.sleep(10)
 
 
 def main():
+    # libcec bindings are loaded only when the server actually starts
+    from pycec.cec import CecAdapter
+
     config = configure()
 
     # Configure logging
     setup_logger(config)
 
-    transports = set()
     loop = asyncio.get_event_loop()
-    network = HDMINetwork(CecAdapter("pyCEC", activate_source=False),
-                          loop=loop)
-
-    class CECServerProtocol(asyncio.Protocol):
-        transport = None
-        buffer = ''
-
-        def connection_made(self, transport):
-            _LOGGER.info("Connection opened by %s",
-                         transport.get_extra_info('peername'))
-            self.transport = transport
-            transports.add(transport)
-
-        def data_received(self, data):
-            self.buffer += bytes.decode(data)
-            for line in self.buffer.splitlines(keepends=True):
-                if line.endswith('\r') or line.endswith('\n'):
-                    line = line.rstrip()
-                    if len(line) == 2:
-                        _LOGGER.info("Received poll %s from %s", line,
-                                     self.transport.get_extra_info('peername'))
-                        d = CecCommand(line).dst
-                        t = network._adapter.poll_device(d)
-                        t.add_done_callback(
-                            functools.partial(_after_poll, d))
-                    else:
-                        _LOGGER.info("Received command %s from %s", line,
-                                     self.transport.get_extra_info('peername'))
-                        network.send_command(CecCommand(line))
-                    self.buffer = ''
-                else:
-                    self.buffer = line
-
-        def connection_lost(self, exc):
-            _LOGGER.info("Connection with %s lost",
-                         self.transport.get_extra_info('peername'))
-            transports.remove(self.transport)
-
-    def _after_poll(d, f):
-        if f.result():
-            cmd = PollCommand(network._adapter.get_logical_address(), src=d)
-            _send_command_to_tcp(cmd)
-
-    def _send_command_to_tcp(command):
-        for t in transports:
-            _LOGGER.info("Sending %s to %s", command,
-                         t.get_extra_info('peername'))
-            t.write(str.encode("%s\r\n" % command.raw))
-
-    network.set_command_callback(_send_command_to_tcp)
+    adapter = CecAdapter(
+        "pyCEC", activate_source=False,
+        port=config['DEFAULT']['adapterPort'] or None,
+        port_cache=config['DEFAULT']['adapterPortCache'] or None)
+    network = HDMINetwork(adapter, loop=loop)
+    cec_server = CecServer(
+        network, loop, queue_size=int(config['DEFAULT']['queueSize']),
+        slow_client_policy=config['DEFAULT']['slowClientPolicy'],
+        max_age=float(config['DEFAULT']['maxAge']),
+        poll_reuse=float(config['DEFAULT']['pollReuse']),
+        history_size=int(config['DEFAULT']['historySize']))
+
+    network.set_frame_callback(cec_server.send_command)
+    network.set_poll_function(cec_server.poll_device)
     loop.run_until_complete(network.async_init())
+    loop.create_task(network.async_watch())
 
     _LOGGER.info("CEC initialized... Starting server.")
     # Each client connection will create a new protocol instance
-    coro = loop.create_server(CECServerProtocol, config['DEFAULT']['host'],
+    coro = loop.create_server(cec_server.create_protocol,
+                              config['DEFAULT']['host'],
                               int(config['DEFAULT']['port']))
     server = loop.run_until_complete(coro)
     # Serve requests until Ctrl+C is pressed
     _LOGGER.info('Serving on {}'.format(server.sockets[0].getsockname()))
     if _LOGGER.level >= logging.DEBUG:
-        loop.create_task(async_show_devices(network, loop))
+        loop.create_task(async_show_devices(network, loop, cec_server))
     try:
         loop.run_forever()
     except KeyboardInterrupt:
@@ -109,6 +81,43 @@ def configure():
                       default=DEFAULT_PORT,
                       help=("Port to bind to. Default is '%s'."
                             % DEFAULT_PORT))
+    parser.add_option("--adapter", dest="adapter_port", action="store",
+                      type="string", default="",
+                      help=("Port of CEC adapter to open without detecting "
+                            "adapters, e.g. '/dev/ttyACM0' or 'RPI'."))
+    parser.add_option("--adapter-cache", dest="adapter_port_cache",
+                      action="store", type="string",
+                      default=DEFAULT_ADAPTER_PORT_CACHE,
+                      help=("File remembering port of the last opened "
+                            "adapter, empty disables it. Default is '%s'."
+                            % DEFAULT_ADAPTER_PORT_CACHE))
+    parser.add_option("--queue-size", dest="queue_size", action="store",
+                      type="int", default=DEFAULT_QUEUE_SIZE,
+                      help=("Messages queued for a client which doesn't keep "
+                            "up. Default is '%s'." % DEFAULT_QUEUE_SIZE))
+    parser.add_option("--slow-client-policy", dest="slow_client_policy",
+                      action="store", type="choice",
+                      choices=[POLICY_DROP, POLICY_DISCONNECT],
+                      default=DEFAULT_SLOW_CLIENT_POLICY,
+                      help=("What to do when client's queue is full: '%s' "
+                            "oldest messages or '%s' the client. Default is "
+                            "'%s'." % (POLICY_DROP, POLICY_DISCONNECT,
+                                       DEFAULT_SLOW_CLIENT_POLICY)))
+    parser.add_option("--max-age", dest="max_age", action="store",
+                      type="float", default=DEFAULT_MAX_AGE,
+                      help=("Maximal age in seconds of cached device state "
+                            "used to answer status requests. Default is '%s'."
+                            % DEFAULT_MAX_AGE))
+    parser.add_option("--poll-reuse", dest="poll_reuse", action="store",
+                      type="float", default=DEFAULT_POLL_REUSE,
+                      help=("Seconds a poll result is reused for other "
+                            "clients' polls of the same device, 0 disables "
+                            "it. Default is '%s'." % DEFAULT_POLL_REUSE))
+    parser.add_option("--history", dest="history_size", action="store",
+                      type="int", default=DEFAULT_HISTORY_SIZE,
+                      help=("Count of recent frames sent to clients asking "
+                            "for a snapshot. Default is '%s'."
+                            % DEFAULT_HISTORY_SIZE))
     parser.add_option("-v", "--verbose", dest="verbose", action="count",
                       default=0, help="Increase verbosity.")
     parser.add_option("-q", "--quiet", dest="quiet", action="count",
@@ -117,6 +126,13 @@ def configure():
     script_dir = os.path.dirname(os.path.realpath(__file__))
     config = configparser.ConfigParser()
     config['DEFAULT'] = {'host': options.host, 'port': options.port,
+                         'adapterPort': options.adapter_port,
+                         'adapterPortCache': options.adapter_port_cache,
+                         'queueSize': options.queue_size,
+                         'slowClientPolicy': options.slow_client_policy,
+                         'maxAge': options.max_age,
+                         'pollReuse': options.poll_reuse,
+                         'historySize': options.history_size,
                          'logLevel': logging.INFO + (
                              (options.quiet - options.verbose) * 10)}
     paths = ['/etc/pycec.conf', script_dir + '/pycec.conf']
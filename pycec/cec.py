@@ -1,23 +1,69 @@
 from concurrent.futures import ThreadPoolExecutor
 
 import logging
+import time
 
 from pycec.commands import CecCommand, KeyPressCommand
 from pycec.const import VENDORS, ADDR_RECORDINGDEVICE1
-from pycec.network import AbstractCecAdapter
+from pycec.network import AbstractCecAdapter, CONNECTION_CONNECTED, \
+    CONNECTION_DISCONNECTED
 
 _LOGGER = logging.getLogger(__name__)
 
 
+class ExecutorLane:
+    """Single thread executor counting queued calls."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._executor = ThreadPoolExecutor(
+            1, thread_name_prefix="pycec-%s" % name)
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+
+    def submit(self, loop, func, *args):
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        future = loop.run_in_executor(self._executor, func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.pending -= 1
+        self.completed += 1
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+    def __str__(self):
+        return "%s: %d pending (max %d), %d completed" % (
+            self.name, self.pending, self.max_pending, self.completed)
+
+
 # pragma: no cover
 class CecAdapter(AbstractCecAdapter):
+    """libcec adapter.
+
+    Polls block until libcec gives up on absent devices, so they run in their
+    own lane and don't delay transmits of interactive commands.
+
+    Adapter on ``port`` or the one remembered in ``port_cache`` file is
+    opened directly, detection of adapters is used only when that fails.
+    """
+
     def __init__(self, name: str = None, monitor_only: bool = None,
                  activate_source: bool = None,
-                 device_type=ADDR_RECORDINGDEVICE1):
+                 device_type=ADDR_RECORDINGDEVICE1, port: str = None,
+                 port_cache: str = None):
         super().__init__()
         self._adapter = None
-        self._io_executor = ThreadPoolExecutor(1)
+        self._port = port
+        self._port_cache = port_cache
+        self._io_lane = ExecutorLane("io")
+        self._poll_lane = ExecutorLane("poll")
         import cec
+        self._cec = cec
         self._cecconfig = cec.libcec_configuration()
         if monitor_only is not None:
             self._cecconfig.bMonitorOnly = 1 if monitor_only else 0
@@ -27,64 +73,127 @@ class CecAdapter(AbstractCecAdapter):
         self._cecconfig.deviceTypes.Add(device_type)
 
     def set_command_callback(self, callback):
+        # libcec passes received frames to Python only as log lines
         self._cecconfig.SetKeyPressCallback(
-            lambda key, delay: callback(KeyPressCommand(key).raw))
+            lambda key, delay: callback(KeyPressCommand(key)))
         self._cecconfig.SetCommandCallback(callback)
 
+    @property
+    def lanes(self):
+        return self._io_lane, self._poll_lane
+
     def standby_devices(self):
-        self._loop.run_in_executor(self._io_executor,
-                                   self._adapter.StandbyDevices)
+        self._io_lane.submit(self._loop, self._adapter.StandbyDevices)
 
     def poll_device(self, device):
-        return self._loop.run_in_executor(
-            self._io_executor, self._adapter.PollDevice, device)
+        return self._poll_lane.submit(self._loop, self._poll_device, device)
+
+    def _poll_device(self, device):
+        start = time.monotonic()
+        result = self._adapter.PollDevice(device)
+        if result:
+            self._poll_times.add(device, time.monotonic() - start)
+        return result
 
     def shutdown(self):
-        self._io_executor.shutdown()
+        self._io_lane.shutdown()
+        self._poll_lane.shutdown()
         if self._adapter:
             self._adapter.Close()
+        self._set_connection_state(CONNECTION_DISCONNECTED)
 
     def get_logical_address(self):
         return self._adapter.GetLogicalAddresses().primary
 
     def power_on_devices(self):
-        self._loop.run_in_executor(self._io_executor,
-                                   self._adapter.PowerOnDevices)
+        self._io_lane.submit(self._loop, self._adapter.PowerOnDevices)
 
     def transmit(self, command: CecCommand):
-        self._loop.run_in_executor(
-            self._io_executor, self._adapter.Transmit,
-            self._adapter.CommandFromString(command.raw))
+        return self._io_lane.submit(self._loop, self._transmit, command)
+
+    def _transmit(self, command: CecCommand):
+        return bool(self._adapter.Transmit(self._to_cec_command(command)))
+
+    def _to_cec_command(self, command: CecCommand):
+        result = self._cec.cec_command()
+        result.initiator = 0xf if command.src is None else command.src
+        result.destination = 0xf if command.dst is None else command.dst
+        if command.cmd is not None:
+            result.opcode = command.cmd
+            result.opcode_set = 1
+            for parameter in command.att:
+                result.parameters.PushBack(parameter)
+        return result
 
     def init(self, callback: callable = None):
-        return self._loop.run_in_executor(self._io_executor, self._init,
-                                          callback)
+        return self._io_lane.submit(self._loop, self._init, callback)
 
     def _init(self, callback: callable = None):
-        import cec
         if not self._cecconfig.clientVersion:
-            self._cecconfig.clientVersion = cec.LIBCEC_VERSION_CURRENT
+            self._cecconfig.clientVersion = self._cec.LIBCEC_VERSION_CURRENT
         _LOGGER.debug("Initializing CEC...")
-        adapter = cec.ICECAdapter.Create(self._cecconfig)
+        start = time.monotonic()
+        adapter = self._cec.ICECAdapter.Create(self._cecconfig)
         _LOGGER.debug("Created adapter")
-        a = None
-        adapters = adapter.DetectAdapters()
-        for a in adapters:
+        port = self._port or self._read_port_cache()
+        if port is not None and not self._open(adapter, port):
+            _LOGGER.info("Unable to open %s, detecting adapters", port)
+            port = None
+        if port is None:
+            port = self._detect_port(adapter)
+            if port is not None and not self._open(adapter, port):
+                port = None
+        if port is None:
+            _LOGGER.error("failed to open a connection to the CEC adapter")
+            self._set_connection_state(CONNECTION_DISCONNECTED)
+        else:
+            _LOGGER.info("connection to %s opened in %.2f s", port,
+                         time.monotonic() - start)
+            self._adapter = adapter
+            self._initialized = True
+            self._write_port_cache(port)
+            self._set_connection_state(CONNECTION_CONNECTED)
+        if callback:
+            callback()
+
+    @staticmethod
+    def _open(adapter, port):
+        if adapter.Open(port):
+            return True
+        adapter.Close()
+        return False
+
+    @staticmethod
+    def _detect_port(adapter):
+        start = time.monotonic()
+        port = None
+        for a in adapter.DetectAdapters():
             _LOGGER.info("found a CEC adapter:")
             _LOGGER.info("port:     " + a.strComName)
             _LOGGER.info("vendor:   " + (
                 VENDORS[a.iVendorId] if a.iVendorId in VENDORS else hex(
                     a.iVendorId)))
             _LOGGER.info("product:  " + hex(a.iProductId))
-            a = a.strComName
-        if a is None:
+            port = a.strComName
+        _LOGGER.debug("Detection took %.2f s", time.monotonic() - start)
+        if port is None:
             _LOGGER.warning("No adapters found")
-        else:
-            if adapter.Open(a):
-                _LOGGER.info("connection opened")
-                self._adapter = adapter
-                self._initialized = True
-            else:
-                _LOGGER.error("failed to open a connection to the CEC adapter")
-        if callback:
-            callback()
+        return port
+
+    def _read_port_cache(self):
+        if not self._port_cache:
+            return None
+        try:
+            with open(self._port_cache) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_port_cache(self, port):
+        if not self._port_cache or port == self._port:
+            return
+        try:
+            with open(self._port_cache, 'w') as f:
+                f.write(port)
+        except OSError as e:
+            _LOGGER.warning("Unable to cache adapter port: %s", e)
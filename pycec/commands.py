@@ -68,6 +68,12 @@ class CecCommand:
             self._cmd = None
             self._att = None
 
+    @classmethod
+    def from_bytes(cls, data):
+        """Command from frame bytes: header, opcode and parameters."""
+        return cls(data[1] if len(data) > 1 else None, dst=data[0] & 0xf,
+                   src=data[0] >> 4, att=list(data[2:]))
+
     def __str__(self):
         return self.raw
 
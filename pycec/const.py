@@ -64,7 +64,7 @@ CMD_MENU_LANGUAGE = (0x91, 0x32)
 CMD_OSD_NAME = (0x46, 0x47)
 CMD_AUDIO_MODE_STATUS = (0x7d, 0x7e)
 CMD_DECK_STATUS = (0x1a, 0x1b)
-CMD_TUNER_STATUS = (0x07, 0x08)
+CMD_TUNER_STATUS = (0x08, 0x07)
 CMD_MENU_STATUS = (0x8d, 0x8e)
 
 CMD_ACTIVE_SOURCE = 0x82
@@ -73,6 +73,10 @@ CMD_KEY_PRESS = 0x44
 CMD_KEY_RELEASE = 0x45
 CMD_PLAY = 0x41
 CMD_STANDBY = 0x36
+CMD_ROUTING_CHANGE = 0x80
+CMD_IMAGE_VIEW_ON = 0x04
+CMD_TEXT_VIEW_ON = 0x0d
+CMD_FEATURE_ABORT = 0x00
 CMD_POLL = None
 
 STATUS_PLAY = 0x11
@@ -83,6 +87,19 @@ STATUS_OTHER = 0x1f
 
 POWER_ON = 0x00
 POWER_OFF = 0x01
+POWER_TO_ON = 0x02
+POWER_TO_OFF = 0x03
+
+STATUS_REQUEST_ON = 0x01
+STATUS_REQUEST_OFF = 0x02
+STATUS_REQUEST_ONCE = 0x03
+
+ABORT_UNRECOGNIZED_OPCODE = 0x00
+ABORT_NOT_IN_CORRECT_MODE = 0x01
+ABORT_CANNOT_PROVIDE_SOURCE = 0x02
+ABORT_INVALID_OPERAND = 0x03
+ABORT_REFUSED = 0x04
+ABORT_UNABLE_TO_DETERMINE = 0x05
 
 PLAY_FORWARD = 0x24
 PLAY_STILL = 0x25
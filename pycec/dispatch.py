@@ -0,0 +1,141 @@
+"""Dispatch of user callbacks."""
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import logging
+import time
+
+DEFAULT_CALLBACK_QUEUE_SIZE = 64
+DEFAULT_SLOW_CALLBACK = 0.1
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CallbackStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def __str__(self):
+        return "%d calls, %.1f ms average, %.1f ms max" % (
+            self.calls, self.total / self.calls * 1000 if self.calls else 0,
+            self.max * 1000)
+
+
+class CallbackDispatcher:
+    """Runs user callbacks of a network.
+
+    Callbacks run on the network's loop by default, on ``executor`` or on
+    another ``loop`` otherwise, so that slow ones don't hold up frame
+    processing. Callbacks sharing a key (logical address of the device they
+    concern) run one at a time in order, callbacks of different keys may run
+    concurrently. Coalesced callbacks are queued at most once per key, as
+    they read current state anyway. Callbacks running on the network's loop
+    are never dropped. With an executor or another loop a key queues at
+    most ``maxsize`` callbacks and drops the oldest beyond that, so a stuck
+    callback can't make the queue grow without bound. Execution time is
+    measured per callback and those slower than ``slow_threshold`` seconds
+    are logged.
+    """
+
+    def __init__(self, executor: concurrent.futures.Executor = None,
+                 loop: asyncio.AbstractEventLoop = None,
+                 maxsize=DEFAULT_CALLBACK_QUEUE_SIZE,
+                 slow_threshold=DEFAULT_SLOW_CALLBACK):
+        if executor is not None and loop is not None:
+            raise ValueError("Use either executor or loop")
+        self._executor = executor
+        self._target_loop = loop
+        self._maxsize = maxsize
+        self._slow_threshold = slow_threshold
+        self._loop = None
+        self._queues = dict()
+        self._running = set()
+        self.stats = dict()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def set_event_loop(self, loop):
+        self._loop = loop
+
+    def dispatch(self, key, callback: callable, *args, coalesce=False):
+        """Queue ``callback(*args)``, must be called on the network's loop."""
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = collections.deque()
+            self._queues[key] = queue
+        if coalesce and any(c is callback and co for c, a, co in queue):
+            self.coalesced += 1
+            return
+        if (self._executor is not None or self._target_loop is not None) \
+                and len(queue) >= self._maxsize:
+            queue.popleft()
+            self.dropped += 1
+        queue.append((callback, args, coalesce))
+        if key not in self._running:
+            self._running.add(key)
+            if self._executor is None and self._target_loop is None:
+                self._loop.call_soon(self._run_queued, key)
+            else:
+                self._submit_next(key)
+
+    def _run_queued(self, key):
+        queue = self._queues[key]
+        while queue:
+            callback, args, coalesce = queue.popleft()
+            self._record(callback, _timed(callback, args))
+        self._running.discard(key)
+
+    def _submit_next(self, key):
+        queue = self._queues[key]
+        if not queue:
+            self._running.discard(key)
+            return
+        callback, args, coalesce = queue.popleft()
+        call = functools.partial(_timed, callback, args)
+        if self._executor is not None:
+            future = self._loop.run_in_executor(self._executor, call)
+        else:
+            result = concurrent.futures.Future()
+            self._target_loop.call_soon_threadsafe(_run_into, call, result)
+            future = asyncio.wrap_future(result, loop=self._loop)
+        future.add_done_callback(
+            functools.partial(self._submitted_done, key, callback))
+
+    def _submitted_done(self, key, callback, future):
+        if not future.cancelled() and future.exception() is None:
+            self._record(callback, future.result())
+        self._submit_next(key)
+
+    def _record(self, callback, elapsed):
+        name = getattr(callback, '__qualname__', repr(callback))
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = CallbackStats()
+            self.stats[name] = stats
+        stats.add(elapsed)
+        if elapsed > self._slow_threshold:
+            _LOGGER.warning("Callback %s took %.3f s", name, elapsed)
+
+
+def _timed(callback, args) -> float:
+    start = time.perf_counter()
+    try:
+        callback(*args)
+    except Exception:
+        _LOGGER.exception("Error in callback %s", callback)
+    return time.perf_counter() - start
+
+
+def _run_into(call, result: concurrent.futures.Future):
+    try:
+        result.set_result(call())
+    except BaseException as e:  # pragma: no cover
+        result.set_exception(e)
@@ -0,0 +1,66 @@
+"""Inference of device power status from bus traffic.
+
+Most power transitions are visible in frames devices broadcast anyway, so
+polling for power status is only needed when those leave it uncertain.
+Each inference carries a confidence from 0 to 1 which halves every
+``POWER_HALF_LIFE`` seconds; status below ``POWER_CERTAIN`` is polled.
+"""
+from collections import namedtuple
+
+from pycec.const import ADDR_BROADCAST, CMD_ACTIVE_SOURCE, \
+    CMD_STREAM_PATH, CMD_STANDBY, CMD_ROUTING_CHANGE, CMD_PHYSICAL_ADDRESS, \
+    CMD_IMAGE_VIEW_ON, CMD_TEXT_VIEW_ON, POWER_ON, POWER_OFF
+
+# power status reported by the device itself
+CONFIDENCE_REPORTED = 1.0
+# device announced a state it is in or was told to enter
+CONFIDENCE_ANNOUNCED = 0.9
+# state follows from a request sent to the device
+CONFIDENCE_IMPLIED = 0.4
+# device is present, which it mostly is when on
+CONFIDENCE_PRESENT = 0.1
+
+POWER_CERTAIN = 0.5
+POWER_HALF_LIFE = 300
+
+# Device is given by its logical address, ADDR_BROADCAST standing for all of
+# them, or by physical address as int when logical address is None
+PowerInference = namedtuple('PowerInference', ['logical_address',
+                                               'physical_address', 'status',
+                                               'confidence'])
+
+
+def _physical(att) -> int:
+    return att[0] << 8 | att[1]
+
+
+def infer_power(command) -> tuple:
+    """``PowerInference`` tuples following from a valid ``command``."""
+    cmd = command.cmd
+    if cmd == CMD_STANDBY:
+        return (PowerInference(command.dst, None, POWER_OFF,
+                               CONFIDENCE_ANNOUNCED),)
+    if cmd == CMD_ACTIVE_SOURCE:
+        return (PowerInference(command.src, None, POWER_ON,
+                               CONFIDENCE_ANNOUNCED),)
+    if cmd in (CMD_STREAM_PATH, CMD_ROUTING_CHANGE):
+        # TV or switch selects a new path, its end is asked to become active
+        target = command.att[0:2] if cmd == CMD_STREAM_PATH else \
+            command.att[2:4]
+        return (PowerInference(command.src, None, POWER_ON,
+                               CONFIDENCE_ANNOUNCED),
+                PowerInference(None, _physical(target), POWER_ON,
+                               CONFIDENCE_IMPLIED))
+    if cmd in (CMD_IMAGE_VIEW_ON, CMD_TEXT_VIEW_ON) and \
+            command.dst != ADDR_BROADCAST:
+        return (PowerInference(command.dst, None, POWER_ON,
+                               CONFIDENCE_IMPLIED),)
+    if cmd == CMD_PHYSICAL_ADDRESS[1]:
+        return (PowerInference(command.src, None, POWER_ON,
+                               CONFIDENCE_PRESENT),)
+    return ()
+
+
+def decayed(confidence: float, age: float) -> float:
+    """``confidence`` of an inference made ``age`` seconds ago."""
+    return confidence * 0.5 ** (age / POWER_HALF_LIFE)
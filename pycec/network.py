@@ -1,28 +1,74 @@
 import asyncio
+import collections
 import functools
 from functools import reduce
-from multiprocessing import Queue
-from typing import List
+from typing import List, Optional
 
 import time
 
 from pycec import _LOGGER
-from pycec.commands import CecCommand
+from pycec.commands import CecCommand, KeyPressCommand, KeyReleaseCommand
 from pycec.const import CMD_OSD_NAME, VENDORS, DEVICE_TYPE_NAMES, \
     CMD_ACTIVE_SOURCE, CMD_STREAM_PATH, ADDR_BROADCAST, CMD_DECK_STATUS, \
-    CMD_AUDIO_STATUS
+    CMD_AUDIO_STATUS, KEY_VOLUME_UP, KEY_VOLUME_DOWN, KEY_POWER_ON, \
+    KEY_POWER_OFF, KEY_MUTE_ON, KEY_MUTE_OFF, POWER_ON, POWER_OFF, \
+    POWER_TO_ON, POWER_TO_OFF, CMD_TUNER_STATUS, CEC_LOGICAL_TO_TYPE, \
+    TYPE_TUNER, TYPE_RECORDER, STATUS_REQUEST_ON, STATUS_REQUEST_ONCE, \
+    CMD_ROUTING_CHANGE, CMD_STANDBY, CMD_FEATURE_ABORT, \
+    ABORT_UNRECOGNIZED_OPCODE
 from pycec.const import CMD_PHYSICAL_ADDRESS, CMD_POWER_STATUS, CMD_VENDOR
+from pycec.dispatch import CallbackDispatcher
+from pycec.inference import CONFIDENCE_REPORTED, CONFIDENCE_IMPLIED, \
+    POWER_CERTAIN, decayed, infer_power
+from pycec.opcodes import describe, opcode_name, reply_opcode, validate
+from pycec.subscription import CommandSubscription, \
+    DEFAULT_SUBSCRIPTION_SIZE, OVERFLOW_DROP_OLDEST
+from pycec.timing import RoundTripTimes
 
 DEFAULT_SCAN_INTERVAL = 30
 DEFAULT_UPDATE_PERIOD = 30
 DEFAULT_SCAN_DELAY = 1
+DEFAULT_ACK_TIMEOUT = 5
+DEFAULT_INBOUND_QUEUE_SIZE = 256
+DEFAULT_KEY_HOLD = 0
+DEFAULT_KEY_GAP = 0.1
+KEY_REPEAT_INTERVAL = 0.4
+DEFAULT_VOLUME_TIMEOUT = 10
+UNSUPPORTED_RECHECK = 3600
+
+STATE_POWER = "power"
+STATE_MUTE = "mute"
+STATE_VOLUME = "volume"
+
+CONNECTION_DISCONNECTED = "disconnected"
+CONNECTION_CONNECTING = "connecting"
+CONNECTION_CONNECTED = "connected"
 
 UPDATEABLE = {CMD_POWER_STATUS: "_update_power_status",
               CMD_OSD_NAME: "_update_osd_name", CMD_VENDOR: "_update_vendor",
               CMD_PHYSICAL_ADDRESS: "_update_physical_address",
               CMD_DECK_STATUS: "_update_playing_status",
+              CMD_TUNER_STATUS: "_update_tuner_status",
               CMD_AUDIO_STATUS: "_update_audio_status"}
 
+# Requests devices can answer on every change instead of once
+REPORTABLE = (CMD_DECK_STATUS[0], CMD_TUNER_STATUS[0])
+
+# Bit of updateable property in update flags by opcode of request
+_UPDATE_INDEX = {prop[0]: i for i, prop in enumerate(UPDATEABLE)}
+# Index of updateable property and its updater by opcode of reply
+_UPDATERS = {prop[1]: (_UPDATE_INDEX[prop[0]], name)
+             for prop, name in UPDATEABLE.items()}
+
+
+# Immutable views of state published on every change, see ``snapshot``
+DeviceSnapshot = collections.namedtuple('DeviceSnapshot', [
+    'version', 'logical_address', 'physical_address', 'type',
+    'power_status', 'vendor_id', 'osd_name', 'volume_status', 'mute_status',
+    'status', 'tuner_status'])
+NetworkSnapshot = collections.namedtuple('NetworkSnapshot', [
+    'version', 'devices', 'active_source'])
+
 
 class PhysicalAddress:
     def __init__(self, address):
@@ -57,6 +103,13 @@ class PhysicalAddress:
     def asstr(self) -> str:
         return ".".join(("%x" % x) for x in _to_digits(self._physical_address))
 
+    def __eq__(self, other):
+        return isinstance(other, PhysicalAddress) and \
+            self._physical_address == other._physical_address
+
+    def __hash__(self):
+        return self._physical_address
+
     def __str__(self):
         return self.asstr
 
@@ -65,6 +118,10 @@ class AbstractCecAdapter:
     def __init__(self):
         self._initialized = False
         self._loop = None
+        self._poll_times = RoundTripTimes()
+        self._reply_times = RoundTripTimes()
+        self._connection_state = None
+        self._connection_callback = None
 
     def init(self, callback: callable = None):
         raise NotImplementedError
@@ -76,6 +133,11 @@ class AbstractCecAdapter:
         raise NotImplementedError
 
     def transmit(self, command: CecCommand):
+        """Send command to the bus.
+
+        Adapters able to tell whether the command was acknowledged return an
+        awaitable resolving to ``True`` or ``False``, others ``None``.
+        """
         raise NotImplementedError
 
     def standby_devices(self):
@@ -94,11 +156,48 @@ class AbstractCecAdapter:
     def initialized(self):
         return self._initialized
 
+    @property
+    def connection_state(self):
+        return self._connection_state
+
+    @property
+    def connected(self):
+        """Adapters which don't report connection state count as connected."""
+        return self._connection_state in (None, CONNECTION_CONNECTED)
+
+    def set_connection_callback(self, callback):
+        self._connection_callback = callback
+
+    def _set_connection_state(self, state):
+        if state == self._connection_state:
+            return
+        self._connection_state = state
+        if self._connection_callback and self._loop and \
+                not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._connection_callback, state)
+
+    @property
+    def poll_times(self) -> RoundTripTimes:
+        return self._poll_times
+
+    @property
+    def reply_times(self) -> RoundTripTimes:
+        return self._reply_times
+
     def set_event_loop(self, loop):
         self._loop = loop
 
 
 class HDMIDevice:
+    __slots__ = ('_loop', '_logical_address', 'name', '_physical_address',
+                 '_power_status', '_vendor_id', '_osd_name', '_volume_status',
+                 '_volume_step', '_mute_status', '_network', '_updated',
+                 '_update_times', '_stop', '_update_period', '_type',
+                 '_update_callback', '_status', '_tuner_status', '_task',
+                 '_snapshot', '_reporting', '_polled_only',
+                 '_power_confidence', '_power_time', '_power_poll',
+                 '_unsupported', '__weakref__')
+
     def __init__(self, logical_address: int, network=None,
                  update_period=DEFAULT_UPDATE_PERIOD,
                  loop=None):
@@ -107,28 +206,34 @@ class HDMIDevice:
         self.name = "hdmi_%x" % logical_address
         self._physical_address = None
         self._power_status = int()
-        self._audio_status = int()
-        self._is_active_source = False
         self._vendor_id = int()
-        self._menu_language = str()
         self._osd_name = str()
-        self._audio_mode_status = int()
         self._volume_status = int()
+        self._volume_step = None
         self._mute_status = False
-        self._deck_status = int()
-        self._tuner_status = int()
-        self._menu_status = int()
-        self._record_status = int()
-        self._timer_cleared_status = int()
-        self._timer_status = int()
         self._network = network
-        self._updates = {cmd: False for cmd in UPDATEABLE}
+        # bit mask of valid updateable properties, see _UPDATE_INDEX
+        self._updated = 0
+        self._update_times = [0.0] * len(UPDATEABLE)
         self._stop = False
         self._update_period = update_period
         self._type = int()
         self._update_callback = None
         self._status = None
+        self._tuner_status = None
         self._task = None
+        self._snapshot = None
+        # bit masks of reportable properties the device reports on change
+        # and of those it refused to report, see _UPDATE_INDEX
+        self._reporting = 0
+        self._polled_only = 0
+        # confidence in _power_status when inferred at monotonic _power_time
+        self._power_confidence = 0.0
+        self._power_time = 0.0
+        self._power_poll = None
+        # opcode -> monotonic time device aborted it as unrecognized
+        self._unsupported = None
+        self._publish()
 
     @property
     def logical_address(self) -> int:
@@ -142,10 +247,39 @@ class HDMIDevice:
     def power_status(self) -> int:
         return self._power_status
 
+    @property
+    def power_confidence(self) -> float:
+        """Current confidence in ``power_status`` from 0 to 1."""
+        if not self._power_confidence:
+            return 0.0
+        return decayed(self._power_confidence, self.power_age)
+
+    @property
+    def power_age(self) -> Optional[float]:
+        """Seconds since ``power_status`` was last reported or inferred."""
+        if not self._power_confidence:
+            return None
+        return time.monotonic() - self._power_time
+
+    @property
+    def power_certain(self) -> bool:
+        return self.power_confidence >= POWER_CERTAIN
+
+    @property
+    def is_active_source(self) -> bool:
+        return self._network is not None and \
+            self._physical_address is not None and \
+            self._network.active_source_address == self._physical_address
+
     @property
     def status(self) -> int:
         return self._status
 
+    @property
+    def tuner_status(self) -> tuple:
+        """Raw tuner device info operands."""
+        return self._tuner_status
+
     @property
     def vendor_id(self) -> int:
         return self._vendor_id
@@ -208,15 +342,48 @@ class HDMIDevice:
         return self._volume_status
 
     def update_callback(self, command: CecCommand):
-        result = False
-        for prop in filter(lambda x: x[1] == command.cmd, UPDATEABLE):
-            getattr(self, UPDATEABLE[prop])(command)
-            self._updates[prop[0]] = True
-            result = True
-        if result:  # pragma: no cover
-            if self._update_callback:
+        updater = _UPDATERS.get(command.cmd)
+        if updater is None:
+            return False
+        self._updated |= 1 << updater[0]
+        self._update_times[updater[0]] = time.monotonic()
+        getattr(self, updater[1])(command)
+        self._publish()
+        if self._network is None:
+            self._notify()
+        return True
+
+    def _notify(self):
+        # devices of a network are notified once the network snapshot
+        # includes their change
+        if self._update_callback:  # pragma: no cover
+            if self._network is None:
                 self._loop.call_soon_threadsafe(self._update_callback, self)
-        return result
+            else:
+                self._network.dispatch_callback(
+                    self._logical_address, self._update_callback, self,
+                    coalesce=True)
+
+    @property
+    def snapshot(self) -> DeviceSnapshot:
+        """Consistent view of the device's state.
+
+        A new snapshot with incremented version replaces the previous one
+        whenever the state changes, so other threads can read it without
+        locking and compare versions to skip unchanged devices.
+        """
+        return self._snapshot
+
+    def _publish(self):
+        previous = self._snapshot
+        state = (self._logical_address, self._physical_address, self._type,
+                 self._power_status, self._vendor_id, self._osd_name,
+                 self._volume_status, self._mute_status, self._status,
+                 self._tuner_status)
+        if previous is None:
+            self._snapshot = DeviceSnapshot(0, *state)
+        elif previous[1:] != state:
+            self._snapshot = DeviceSnapshot(previous.version + 1, *state)
 
     def _update_osd_name(self, command):
         self._osd_name = reduce(lambda x, y: x + chr(y), command.att, "")
@@ -227,8 +394,54 @@ class HDMIDevice:
     def _update_playing_status(self, command):
         self._status = command.att[0]
 
+    def _update_tuner_status(self, command):
+        self._tuner_status = tuple(command.att)
+
     def _update_power_status(self, command):
-        self._power_status = command.att[0]
+        self.infer_power_status(command.att[0], CONFIDENCE_REPORTED)
+
+    def infer_power_status(self, status: int, confidence: float) -> bool:
+        """Take ``status`` unless current one is more certain.
+
+        Power status is polled when the result is still uncertain. Returns
+        whether the status changed.
+        """
+        if confidence < self.power_confidence:
+            # less certain evidence can't override, only question it
+            if confidence >= CONFIDENCE_IMPLIED and \
+                    _is_on(status) != _is_on(self._power_status):
+                self._schedule_power_poll()
+            return False
+        changed = status != self._power_status
+        self._set_power_status(status)
+        self._power_confidence = confidence
+        self._power_time = time.monotonic()
+        if confidence < POWER_CERTAIN:
+            self._schedule_power_poll()
+        return changed
+
+    def _schedule_power_poll(self):
+        if self._network is None or self._stop or \
+                not self._network.connected or (
+                    self._power_poll is not None and
+                    not self._power_poll.done()):
+            return
+        self._power_poll = self._loop.create_task(
+            self.async_request_update(CMD_POWER_STATUS[0]))
+
+    def _set_power_status(self, status: int):
+        was_on = _is_on(self._power_status)
+        self._power_status = status
+        is_on = _is_on(status)
+        if was_on == is_on:
+            return
+        # devices forget reporting subscriptions when power cycled
+        self._reporting = self._polled_only = 0
+        if is_on and self._network is not None and \
+                not self._stop and self._network.connected:
+            for cmd in REPORTABLE:
+                if self._applicable(cmd):
+                    self._loop.create_task(self.async_subscribe(cmd))
 
     def _update_physical_address(self, command):
         self._physical_address = PhysicalAddress(command.att[0:2])
@@ -240,7 +453,7 @@ class HDMIDevice:
         raw_volume_status = command.att[0] & 0x7f
         if raw_volume_status == 0x7f:
             # Volume is unknown
-            self._updates[CMD_AUDIO_STATUS[0]] = False
+            self._updated &= ~(1 << _UPDATE_INDEX[CMD_AUDIO_STATUS[0]])
         else:
             # Valid volumes cover a range of 0-100, just clamp invalid values
             self._volume_status = min(raw_volume_status, 100)
@@ -256,9 +469,10 @@ class HDMIDevice:
     async def async_run(self):
         _LOGGER.debug("Starting device %d", self.logical_address)
         while not self._stop:
-            for prop in UPDATEABLE:
-                if not self._stop:
-                    await self.async_request_update(prop[0])
+            if self._network.connected:
+                await asyncio.gather(
+                    *(self._async_refresh(prop[0]) for prop in UPDATEABLE
+                      if self._applicable(prop[0])))
             start_time = self._loop.time()
             while not self._stop and self._loop.time() <= (
                 start_time + self._update_period
@@ -270,25 +484,182 @@ class HDMIDevice:
         _LOGGER.debug("HDMI device %s stopping", self)
         self._stop = True
 
+    def _applicable(self, cmd: int) -> bool:
+        if cmd == CMD_TUNER_STATUS[0] and \
+                CEC_LOGICAL_TO_TYPE[self._logical_address] not in (
+                    TYPE_TUNER, TYPE_RECORDER):
+            return False
+        return self.supports(cmd)
+
+    def supports(self, opcode: int) -> bool:
+        """Whether device didn't abort ``opcode`` as unrecognized within
+        the last ``UNSUPPORTED_RECHECK`` seconds."""
+        if not self._unsupported or opcode not in self._unsupported:
+            return True
+        if time.monotonic() - self._unsupported[opcode] < \
+                UNSUPPORTED_RECHECK:
+            return False
+        del self._unsupported[opcode]
+        return True
+
+    @property
+    def unsupported_opcodes(self) -> tuple:
+        return tuple(op for op in list(self._unsupported or ()) if
+                     not self.supports(op))
+
+    def _feature_aborted(self, opcode: int, reason: int):
+        if reason != ABORT_UNRECOGNIZED_OPCODE:
+            return
+        if self._unsupported is None:
+            self._unsupported = dict()
+        self._unsupported[opcode] = time.monotonic()
+
+    async def _async_refresh(self, cmd: int):
+        if cmd == CMD_POWER_STATUS[0] and self.power_certain:
+            return True
+        if cmd not in REPORTABLE:
+            return await self.async_request_update(cmd)
+        bit = 1 << _UPDATE_INDEX[cmd]
+        if self._reporting & bit:
+            return True
+        if self._polled_only & bit:
+            return await self.async_request_update(cmd)
+        return await self.async_subscribe(cmd)
+
     async def async_request_update(self, cmd: int):
-        self._updates[cmd] = False
-        command = CecCommand(cmd)
-        await self.async_send_command(command)
+        return await self._async_request(
+            cmd, [STATUS_REQUEST_ONCE] if cmd in REPORTABLE else None)
+
+    async def async_subscribe(self, cmd: int):
+        """Ask device to report status requested by ``cmd`` on change.
+
+        ``cmd`` is one of ``REPORTABLE``. Devices which don't reply are
+        polled instead, until they are power cycled.
+        """
+        bit = 1 << _UPDATE_INDEX[cmd]
+        result = await self._async_request(cmd, [STATUS_REQUEST_ON])
+        if result:
+            self._reporting |= bit
+        else:
+            self._polled_only |= bit
+        return result
+
+    async def _async_request(self, cmd: int, att=None):
+        if self._stop:
+            return False
+        self._updated &= ~(1 << _UPDATE_INDEX[cmd])
+        command = CecCommand(cmd, self._logical_address, att=att)
+        return await self._network.async_request(command) is not None
 
     def send_command(self, command):
         self._loop.create_task(self.async_send_command(command))
 
     async def async_send_command(self, command: CecCommand):
         command.dst = self._logical_address
-        await self._network.async_send_command(command)
+        return await self._network.async_send_command(command)
+
+    def send_keys(self, keys, hold=DEFAULT_KEY_HOLD, gap=DEFAULT_KEY_GAP):
+        self._loop.create_task(self.async_send_keys(keys, hold, gap))
+
+    async def async_send_keys(self, keys, hold=DEFAULT_KEY_HOLD,
+                              gap=DEFAULT_KEY_GAP):
+        """See ``HDMINetwork.async_send_keys``."""
+        return await self._network.async_send_keys(self._logical_address,
+                                                   keys, hold, gap)
+
+    async def async_set_volume(self, target: int,
+                               timeout=DEFAULT_VOLUME_TIMEOUT):
+        """Step volume to ``target`` with volume keys.
+
+        Presses needed are estimated from the volume change per press seen
+        so far and sent as one key sequence, audio status request then
+        confirms the result or corrects over- and undershoot in the next
+        round. Returns ``True`` once volume is as close to ``target`` as the
+        device's step allows, ``False`` when volume is unknown or
+        ``timeout`` expires first.
+        """
+        try:
+            return await asyncio.wait_for(self._async_step_volume(target),
+                                          timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.debug("Volume of %s stuck at %d", self,
+                          self._volume_status)
+            return False
+
+    async def _async_step_volume(self, target: int):
+        sent = None
+        while True:
+            if not await self.async_request_update(CMD_AUDIO_STATUS[0]) or \
+                    not self.is_updated(CMD_AUDIO_STATUS[0]):
+                return False
+            volume = self._volume_status
+            if sent and volume != sent[0]:
+                self._volume_step = abs(volume - sent[0]) / sent[1]
+            difference = target - volume
+            if abs(difference) * 2 <= (self._volume_step or 1):
+                return True
+            if self._volume_step:
+                presses = round(abs(difference) / self._volume_step)
+            else:
+                # unknown step, probe with half to avoid big overshoot
+                presses = abs(difference) // 2
+            presses = max(presses, 1)
+            sent = (volume, presses)
+            await self.async_send_keys(
+                [KEY_VOLUME_UP if difference > 0 else KEY_VOLUME_DOWN] *
+                presses)
+
+    async def async_apply_state(self, state: dict):
+        """Bring device to ``state`` using as few commands as possible.
+
+        ``state`` may hold ``STATE_POWER`` and ``STATE_MUTE`` booleans and
+        ``STATE_VOLUME``. Values already known to be in place are skipped,
+        changes are confirmed by status requests. Returns whether all of
+        them were confirmed.
+        """
+        result = True
+        power = state.get(STATE_POWER)
+        if power is not None and not self._has_power(power):
+            await self.async_send_keys(
+                [KEY_POWER_ON if power else KEY_POWER_OFF])
+            await self.async_request_update(CMD_POWER_STATUS[0])
+            result = self._has_power(power)
+        mute = state.get(STATE_MUTE)
+        volume = state.get(STATE_VOLUME)
+        audio_known = self.last_update(CMD_AUDIO_STATUS[0]) is not None
+        muting = mute is not None and not (audio_known and
+                                           self._mute_status == mute)
+        if muting:
+            await self.async_send_keys(
+                [KEY_MUTE_ON if mute else KEY_MUTE_OFF])
+        if volume is not None and not (audio_known and
+                                       self._volume_status == volume):
+            result &= await self.async_set_volume(volume)
+        elif muting:
+            await self.async_request_update(CMD_AUDIO_STATUS[0])
+        if mute is not None:
+            result &= self._mute_status == mute
+        return result
+
+    def _has_power(self, power: bool):
+        if not self.power_certain:
+            return False
+        return self._power_status in (
+            (POWER_ON, POWER_TO_ON) if power else (POWER_OFF, POWER_TO_OFF))
 
     def active_source(self):
         self._loop.create_task(
             self._network.async_active_source(self.physical_address))
 
-    @property
-    def is_updated(self, cmd):
-        return self._updates[cmd]
+    def is_updated(self, cmd: int) -> bool:
+        index = _UPDATE_INDEX.get(cmd)
+        return index is not None and bool(self._updated >> index & 1)
+
+    def last_update(self, cmd: int):
+        """Monotonic time of the last valid reply to request ``cmd``."""
+        if not self.is_updated(cmd):
+            return None
+        return self._update_times[_UPDATE_INDEX[cmd]]
 
     def __eq__(self, other):
         return (isinstance(other, (
@@ -308,9 +679,12 @@ class HDMIDevice:
 
 class HDMINetwork:
     def __init__(self, adapter: AbstractCecAdapter,
-                 scan_interval=DEFAULT_SCAN_INTERVAL, loop=None):
+                 scan_interval=DEFAULT_SCAN_INTERVAL, loop=None,
+                 inbound_queue_size=DEFAULT_INBOUND_QUEUE_SIZE,
+                 callback_dispatcher: CallbackDispatcher = None):
         self._running = False
-        self._device_status = dict()
+        # bit mask of logical addresses answering the last poll
+        self._device_status = 0
         self._managed_loop = loop is None
         if self._managed_loop:
             self._loop = asyncio.new_event_loop()
@@ -319,11 +693,24 @@ class HDMINetwork:
             self._loop = loop
         self._adapter = adapter
         self._adapter.set_event_loop(self._loop)
+        self._dispatcher = callback_dispatcher or CallbackDispatcher()
+        self._dispatcher.set_event_loop(self._loop)
         self._scan_delay = DEFAULT_SCAN_DELAY
         self._scan_interval = scan_interval
-        self._command_queue = Queue()
-        self._devices = dict()
+        # (destination, reply opcode): (time sent, future, request opcode)
+        self._pending_replies = dict()
+        self._inbound = collections.deque(maxlen=inbound_queue_size)
+        self._inbound_scheduled = False
+        self._inbound_dropped = 0
+        self._init_time = None
+        self._active_source = None
+        self._subscriptions = []
+        self._snapshot = NetworkSnapshot(0, (None,) * 0x10, None)
+        # devices indexed by logical address
+        self._devices = [None] * 0x10
         self._command_callback = None
+        self._frame_callback = None
+        self._poll_function = None
         self._device_added_callback = None
         self._initialized_callback = None
         self._device_removed_callback = None
@@ -339,41 +726,74 @@ class HDMINetwork:
         _LOGGER.debug("initializing")  # pragma: no cover
         _LOGGER.debug("setting callback")  # pragma: no cover
         self._adapter.set_command_callback(self.command_callback)
+        self._adapter.set_connection_callback(self._connection_changed)
         _LOGGER.debug("Callback set")  # pragma: no cover
+        start = time.monotonic()
         task = self._adapter.init(self._initialized_callback)
         self._running = True
-        while not (task.done() or task.cancelled()) and self._running:
-            _LOGGER.debug("Init pending - %s", task)  # pragma: no cover
-            await asyncio.sleep(1)
-        _LOGGER.debug("Init done")  # pragma: no cover
+        # wakes up as soon as the adapter is done, checks for stop meanwhile
+        while not task.done() and self._running:
+            await asyncio.wait((task,), timeout=1)
+        if not task.done():
+            _LOGGER.debug("Stopped while initializing")  # pragma: no cover
+            return
+        self._init_time = time.monotonic() - start
+        _LOGGER.info("Adapter initialized in %.3f s", self._init_time)
+
+    @property
+    def init_time(self):
+        """Seconds spent by ``async_init`` waiting for the adapter."""
+        return self._init_time
+
+    @property
+    def connected(self):
+        return self._adapter.connected
+
+    def _connection_changed(self, state):
+        _LOGGER.info("Adapter %s", state)
+        if state == CONNECTION_CONNECTED and any(self._devices):
+            self.scan()
 
     def scan(self):
         self._loop.create_task(self.async_scan())
 
     def _after_polled(self, device, task):
-        self._device_status[device] = task.result()
-        if self._device_status[device] and device not in self._devices:
+        if not self.connected:
+            _LOGGER.debug("Ignoring poll of %d while disconnected", device)
+            return
+        present = bool(task.result())
+        if present:
+            self._device_status |= 1 << device
+        else:
+            self._device_status &= ~(1 << device)
+        if present and self._devices[device] is None:
             self._devices[device] = HDMIDevice(device, self, loop=self._loop)
             if self._device_added_callback:
-                self._loop.call_soon_threadsafe(self._device_added_callback,
-                                                self._devices[device])
+                self.dispatch_callback(device, self._device_added_callback,
+                                       self._devices[device])
             task = self._loop.create_task(self._devices[device].async_run())
             self._devices[device].task = task
+            self._publish(device)
             _LOGGER.debug("Found device %d", device)
-        elif not self._device_status[device] and device in self._devices:
-            self.get_device(device).stop()
+        elif not present and self._devices[device] is not None:
+            self._devices[device].stop()
             if self._device_removed_callback:
-                self._loop.call_soon_threadsafe(self._device_removed_callback,
-                                                self._devices[device])
-            del (self._devices[device])
+                self.dispatch_callback(device, self._device_removed_callback,
+                                       self._devices[device])
+            self._devices[device] = None
+            self._publish(device)
 
     async def async_scan(self):
         _LOGGER.info("Looking for new devices...")
         if not self.initialized:
             _LOGGER.error("Device not initialized!!!")  # pragma: no cover
             return
+        if not self.connected:
+            _LOGGER.debug("Adapter disconnected, skipping scan")
+            return
+        poll = self._poll_function or self._adapter.poll_device
         for d in range(15):
-            task = self._adapter.poll_device(d)
+            task = poll(d)
             task.add_done_callback(functools.partial(self._after_polled, d))
 
     def send_command(self, command):
@@ -383,9 +803,142 @@ class HDMINetwork:
         if isinstance(command, str):
             command = CecCommand(command)
         _LOGGER.debug("<< %s", command)
+        ack = self._transmit(command)
+        if ack is None:
+            return None
+        try:
+            return await asyncio.wait_for(ack, DEFAULT_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            _LOGGER.debug("No acknowledgement of %s", command)
+            return None
+
+    def _transmit(self, command: CecCommand):
         if command.src is None or command.src == 0xf:
             command.src = self._adapter.get_logical_address()
-        self._loop.call_soon_threadsafe(self._adapter.transmit, command)
+        return self._adapter.transmit(command)
+
+    def send_keys(self, dst: int, keys, hold=DEFAULT_KEY_HOLD,
+                  gap=DEFAULT_KEY_GAP):
+        self._loop.create_task(self.async_send_keys(dst, keys, hold, gap))
+
+    async def async_send_keys(self, dst: int, keys, hold=DEFAULT_KEY_HOLD,
+                              gap=DEFAULT_KEY_GAP):
+        """Press and release ``keys`` on ``dst`` one after another.
+
+        Items of ``keys`` are key codes or ``(key, hold)`` pairs. Presses of
+        keys held longer than ``KEY_REPEAT_INTERVAL`` are repeated as remote
+        controls do, ``gap`` separates a release from the next press. All
+        frames are scheduled upfront at absolute loop times and their
+        acknowledgements are awaited together at the end, so neither adapter
+        latency nor this coroutine delays the sequence.
+
+        Returns ``False`` if any frame was refused, ``None`` if the adapter
+        doesn't acknowledge frames and ``True`` otherwise.
+        """
+        when = self._loop.time()
+        handles = []
+        acks = []
+        for item in keys:
+            key, key_hold = item if isinstance(item, tuple) else (item, hold)
+            press = when
+            while True:
+                self._transmit_at(press, KeyPressCommand(key, dst), handles,
+                                  acks)
+                press += KEY_REPEAT_INTERVAL
+                if press >= when + key_hold:
+                    break
+            when += key_hold
+            self._transmit_at(when, KeyReleaseCommand(dst), handles, acks)
+            when += gap
+        try:
+            await asyncio.sleep(max(when - gap - self._loop.time(), 0))
+            results = await asyncio.wait_for(asyncio.gather(*acks),
+                                             DEFAULT_ACK_TIMEOUT)
+        except asyncio.CancelledError:
+            for handle in handles:
+                handle.cancel()
+            self._transmit(KeyReleaseCommand(dst))
+            raise
+        except asyncio.TimeoutError:
+            _LOGGER.debug("Key sequence to %d not acknowledged", dst)
+            return None
+        if False in results:
+            return False
+        return None if None in results else True
+
+    def _transmit_at(self, when, command: CecCommand, handles, acks):
+        ack = self._loop.create_future()
+        handles.append(self._loop.call_at(when, self._transmit_scheduled,
+                                          command, ack))
+        acks.append(ack)
+
+    def _transmit_scheduled(self, command: CecCommand, ack):
+        result = self._transmit(command)
+        if result is None:
+            ack.set_result(None)
+        else:
+            asyncio.ensure_future(result, loop=self._loop).add_done_callback(
+                functools.partial(_copy_ack, ack))
+
+    async def async_request(self, command: CecCommand, reply: int = None):
+        """Send request and wait for ``reply`` opcode from its destination.
+
+        Reply defaults to the one defined for the request's opcode. Returns
+        the reply command or ``None`` when no reply arrived within the
+        timeout derived from measured round-trip times, when the request
+        was aborted or when the destination is known not to support it.
+        """
+        if reply is None:
+            reply = reply_opcode(command.cmd)
+            if reply is None:
+                raise ValueError("No reply defined for %s" % describe(command))
+        device = None if command.dst is None else self._devices[command.dst]
+        if device is not None and not device.supports(command.cmd):
+            _LOGGER.debug("Device %d doesn't support %s", command.dst,
+                          describe(command))
+            return None
+        key = (command.dst, reply)
+        pending = self._pending_replies.get(key)
+        if pending is None:
+            pending = (self._loop.time(), self._loop.create_future(),
+                       command.cmd)
+            self._pending_replies[key] = pending
+        if await self.async_send_command(command) is False:
+            if self._pending_replies.get(key) is pending:
+                del self._pending_replies[key]
+            _LOGGER.debug("Request %s not acknowledged", command)
+            return None
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(pending[1]),
+                self._adapter.reply_times.timeout(command.dst))
+        except asyncio.TimeoutError:
+            if self._pending_replies.get(key) is pending:
+                del self._pending_replies[key]
+            _LOGGER.debug("No reply %02x from %d", reply, command.dst)
+            return None
+
+    def _resolve_reply(self, command: CecCommand):
+        pending = self._pending_replies.pop((command.src, command.cmd), None)
+        if pending is None or pending[1].done():
+            return
+        self._adapter.reply_times.add(command.src,
+                                      self._loop.time() - pending[0])
+        pending[1].set_result(command)
+
+    def _feature_aborted(self, command: CecCommand):
+        opcode, reason = command.att
+        _LOGGER.debug("Device %s aborted %s, reason %d", command.src,
+                      opcode_name(opcode), reason)
+        if command.src is not None and self._devices[command.src] is not None:
+            self._devices[command.src]._feature_aborted(opcode, reason)
+        # Aborts go to the initiator, which may be a server forwarding our
+        # requests under its own address, so match them by what was aborted
+        for key, pending in list(self._pending_replies.items()):
+            if key[0] == command.src and pending[2] == opcode:
+                del self._pending_replies[key]
+                if not pending[1].done():
+                    pending[1].set_result(None)
 
     def standby(self):
         self._loop.create_task(self.async_standby())
@@ -405,17 +958,76 @@ class HDMINetwork:
         self._loop.create_task(self.async_active_source(source))
 
     async def async_active_source(self, addr: PhysicalAddress):
+        self._active_source = addr.asint
+        self._publish()
         await self.async_send_command(
             CecCommand(CMD_ACTIVE_SOURCE, ADDR_BROADCAST, att=addr.asattr))
         await self.async_send_command(
             CecCommand(CMD_STREAM_PATH, ADDR_BROADCAST, att=addr.asattr))
 
+    @property
+    def active_source_address(self) -> PhysicalAddress:
+        """Physical address of the last seen or set active source."""
+        return None if self._active_source is None else PhysicalAddress(
+            self._active_source)
+
+    async def async_apply_scene(self, states: dict,
+                                active_source: int = None):
+        """Bring several devices to a scene at once.
+
+        ``states`` maps logical addresses to states accepted by
+        ``HDMIDevice.async_apply_state``, device on ``active_source``
+        logical address is made active source unless it already is.
+        Commands of different devices are sent concurrently and their
+        confirmations awaited together. Returns whether the whole scene
+        was confirmed.
+        """
+        jobs = []
+        for address, state in states.items():
+            device = self.get_device(address)
+            if device is None:
+                _LOGGER.warning("Unknown device %d in scene", address)
+                return False
+            jobs.append(device.async_apply_state(state))
+        if active_source is not None:
+            device = self.get_device(active_source)
+            if device is None or device.physical_address is None:
+                _LOGGER.warning("Unknown active source %d", active_source)
+                return False
+            if device.physical_address.asint != self._active_source:
+                jobs.append(self.async_active_source(device.physical_address))
+        results = await asyncio.gather(*jobs)
+        return all(r is not False for r in results)
+
+    @property
+    def snapshot(self) -> NetworkSnapshot:
+        """Consistent view of all devices and the active source.
+
+        ``devices`` of the snapshot holds ``DeviceSnapshot`` or ``None`` for
+        every logical address. Replaced as a whole with incremented version
+        on every change, safe to read from any thread.
+        """
+        return self._snapshot
+
+    def _publish(self, *addresses):
+        previous = self._snapshot
+        devices = list(previous.devices)
+        for address in addresses:
+            device = self._devices[address]
+            devices[address] = None if device is None else device.snapshot
+        devices = tuple(devices)
+        active_source = self.active_source_address
+        if devices != previous.devices or \
+                active_source != previous.active_source:
+            self._snapshot = NetworkSnapshot(previous.version + 1, devices,
+                                             active_source)
+
     @property
     def devices(self) -> tuple:
-        return tuple(self._devices.values())
+        return tuple(d for d in self._devices if d is not None)
 
     def get_device(self, i) -> HDMIDevice:
-        return self._devices.get(i, None)
+        return self._devices[i] if i is not None and 0 <= i < 0x10 else None
 
     async def async_watch(self, loop=None):
         _LOGGER.debug("Start watching...")  # pragma: no cover
@@ -423,7 +1035,10 @@ class HDMINetwork:
             loop = self._loop
         _LOGGER.debug("loop: %s", loop)
         while self._running:
-            if self.initialized:
+            if self.initialized and not self.connected:
+                _LOGGER.debug("Disconnected. Waiting for reconnect.")
+                await asyncio.sleep(1)
+            elif self.initialized:
                 _LOGGER.debug("Scanning...")  # pragma: no cover
                 await self.async_scan()
                 _LOGGER.debug("Sleep...")  # pragma: no cover
@@ -446,30 +1061,129 @@ class HDMINetwork:
         if self._managed_loop:
             self._loop.run_in_executor(None, self._loop.run_forever)
 
-    def command_callback(self, raw_command):
-        _LOGGER.debug("%s", raw_command)  # pragma: no cover
-        self._loop.call_soon_threadsafe(self._async_callback, raw_command)
+    def command_callback(self, frame):
+        """Queue frame received by adapter, may be called from any thread.
+
+        Frame is either ``CecCommand`` or libcec log line like
+        ``>> 01:90:00``. Frames are processed in batches on the loop, the
+        loop is woken up only by the first frame of a batch. When the queue
+        is full the oldest frame is dropped.
+        """
+        _LOGGER.debug("%s", frame)  # pragma: no cover
+        if len(self._inbound) == self._inbound.maxlen:
+            self._inbound_dropped += 1
+        self._inbound.append(frame)
+        if not self._inbound_scheduled:
+            self._inbound_scheduled = True
+            self._loop.call_soon_threadsafe(self._drain_inbound)
+
+    def _drain_inbound(self):
+        self._inbound_scheduled = False
+        while self._inbound:
+            frame = self._inbound.popleft()
+            try:
+                self._async_callback(frame)
+            except Exception:
+                _LOGGER.exception("Error processing frame %s", frame)
+
+    def commands(self, predicate: callable = None,
+                 maxsize=DEFAULT_SUBSCRIPTION_SIZE,
+                 overflow=OVERFLOW_DROP_OLDEST) -> CommandSubscription:
+        """Subscribe to inbound frames accepted by ``predicate``.
+
+        Use as ``async for command in network.commands(...)``, optionally
+        within ``async with`` which closes the subscription on exit; see
+        ``CommandSubscription`` for queueing and overflow policies.
+        """
+        subscription = CommandSubscription(
+            self._loop, predicate, maxsize, overflow,
+            on_close=self._subscriptions.remove)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    @property
+    def inbound_dropped(self) -> int:
+        return self._inbound_dropped
 
-    def _async_callback(self, raw_command):
-        command = CecCommand(raw_command[3:])
+    def _async_callback(self, frame):
+        command = frame if isinstance(frame, CecCommand) else \
+            CecCommand.from_bytes(bytes.fromhex(frame[3:].replace(':', '')))
         updated = False
-        if command.src == 15:
-            for i in range(15):
-                updated |= self.get_device(i).update_callback(command)
-                pass
-        elif command.src in self._devices:
-            updated = self.get_device(command.src).update_callback(command)
-            pass
+        # replies are often addressed directly even if meant to be broadcast
+        error = validate(command, addressing=False)
+        if error:
+            _LOGGER.debug("Malformed frame %s: %s", describe(command), error)
+        else:
+            self._resolve_reply(command)
+            if command.cmd == CMD_FEATURE_ABORT:
+                self._feature_aborted(command)
+            changed = []
+            if command.src == 15:
+                for device in self.devices:
+                    if device.update_callback(command):
+                        changed.append(device.logical_address)
+            elif command.src is not None and \
+                    self._devices[command.src] is not None:
+                if self._devices[command.src].update_callback(command):
+                    changed.append(command.src)
+            updated = bool(changed)
+            changed += self._infer(command, changed)
+            if self._track_active_source(command) or changed:
+                self._publish(*changed)
+            for address in changed:
+                self._devices[address]._notify()
+        if self._frame_callback:
+            self._frame_callback(command)
+        for subscription in self._subscriptions:
+            subscription.offer(command)
         if not updated:
             if self._command_callback:
-                self._loop.call_soon_threadsafe(
-                    self._command_callback, command)
+                self.dispatch_callback(command.src, self._command_callback,
+                                       command)
+
+    def _infer(self, command, changed):
+        """Apply power status inferred from ``command`` to devices, return
+        addresses of changed ones not in ``changed`` yet."""
+        inferred = []
+        for inference in infer_power(command):
+            if inference.logical_address == ADDR_BROADCAST:
+                devices = self.devices
+            elif inference.logical_address is not None:
+                device = self._devices[inference.logical_address]
+                devices = () if device is None else (device,)
+            else:
+                devices = [d for d in self.devices
+                           if d.physical_address is not None and
+                           d.physical_address.asint ==
+                           inference.physical_address]
+            for device in devices:
+                if device.infer_power_status(inference.status,
+                                             inference.confidence):
+                    # state differs from what update_callback published
+                    device._publish()
+                    address = device.logical_address
+                    if address not in changed and address not in inferred:
+                        inferred.append(address)
+        return inferred
+
+    def _track_active_source(self, command) -> bool:
+        if command.cmd in (CMD_ACTIVE_SOURCE, CMD_STREAM_PATH):
+            self._active_source = PhysicalAddress(command.att).asint
+        elif command.cmd == CMD_ROUTING_CHANGE:
+            self._active_source = PhysicalAddress(command.att[2:4]).asint
+        elif command.cmd == CMD_STANDBY and command.dst == ADDR_BROADCAST:
+            self._active_source = None
+        else:
+            return False
+        return True
 
     def stop(self):
         _LOGGER.debug("HDMI network shutdown.")  # pragma: no cover
         self._running = False
-        for d in self._devices.values():
+        for d in self.devices:
             d.stop()
+        for subscription in list(self._subscriptions):
+            subscription.close()
         if self._managed_loop:
             self._loop.stop()
             while self._loop.is_running():
@@ -478,9 +1192,26 @@ class HDMINetwork:
         self._adapter.shutdown()
         _LOGGER.info("HDMI network stopped.")  # pragma: no cover
 
+    @property
+    def callback_dispatcher(self) -> CallbackDispatcher:
+        return self._dispatcher
+
+    def dispatch_callback(self, key, callback, *args, coalesce=False):
+        """Run user callback through the network's ``CallbackDispatcher``."""
+        self._dispatcher.dispatch(key, callback, *args, coalesce=coalesce)
+
     def set_command_callback(self, callback):
         self._command_callback = callback
 
+    def set_frame_callback(self, callback):
+        """Callback receiving every inbound frame, handled by device or not."""
+        self._frame_callback = callback
+
+    def set_poll_function(self, function):
+        """Function polling devices for scans instead of the adapter's
+        ``poll_device``, returning a future of the result."""
+        self._poll_function = function
+
     def set_new_device_callback(self, callback):
         self._device_added_callback = callback
 
@@ -491,6 +1222,19 @@ class HDMINetwork:
         self._initialized_callback = callback
 
 
+def _copy_ack(target, source):
+    if target.done():
+        return
+    if source.cancelled() or source.exception() is not None:
+        target.set_result(None)
+    else:
+        target.set_result(source.result())
+
+
 def _to_digits(x: int) -> List[int]:
     for x in ("%04x" % x):
         yield int(x, 16)
+
+
+def _is_on(power_status: int) -> bool:
+    return power_status in (POWER_ON, POWER_TO_ON)
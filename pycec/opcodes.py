@@ -0,0 +1,150 @@
+"""Opcode metadata.
+
+``OPCODES`` is a tuple indexed by opcode holding ``OpcodeInfo`` of each
+opcode defined by HDMI CEC 1.4 and 2.0, or ``None`` for undefined ones. It is
+generated from ``_SPECS`` once at import time and never changes.
+"""
+from collections import namedtuple
+
+from pycec.const import ADDR_BROADCAST
+
+DIRECT = 0x01
+BROADCAST = 0x02
+ANY = DIRECT | BROADCAST
+
+MAX_PARAMETERS = 14
+
+OpcodeInfo = namedtuple('OpcodeInfo', ['opcode', 'name', 'min_length',
+                                       'max_length', 'addressing', 'reply'])
+
+# opcode, name, parameter lengths, addressing and opcode of expected reply
+_SPECS = (
+    (0x00, "FEATURE_ABORT", 2, 2, DIRECT, None),
+    (0x04, "IMAGE_VIEW_ON", 0, 0, DIRECT, None),
+    (0x05, "TUNER_STEP_INCREMENT", 0, 0, DIRECT, None),
+    (0x06, "TUNER_STEP_DECREMENT", 0, 0, DIRECT, None),
+    (0x07, "TUNER_DEVICE_STATUS", 5, 8, DIRECT, None),
+    (0x08, "GIVE_TUNER_DEVICE_STATUS", 1, 1, DIRECT, 0x07),
+    (0x09, "RECORD_ON", 1, 8, DIRECT, 0x0a),
+    (0x0a, "RECORD_STATUS", 1, 3, DIRECT, None),
+    (0x0b, "RECORD_OFF", 0, 0, DIRECT, None),
+    (0x0d, "TEXT_VIEW_ON", 0, 0, DIRECT, None),
+    (0x0f, "RECORD_TV_SCREEN", 0, 0, DIRECT, 0x09),
+    (0x1a, "GIVE_DECK_STATUS", 1, 1, DIRECT, 0x1b),
+    (0x1b, "DECK_STATUS", 1, 1, DIRECT, None),
+    (0x32, "SET_MENU_LANGUAGE", 3, 3, BROADCAST, None),
+    (0x33, "CLEAR_ANALOGUE_TIMER", 11, 11, DIRECT, 0x43),
+    (0x34, "SET_ANALOGUE_TIMER", 11, 11, DIRECT, 0x35),
+    (0x35, "TIMER_STATUS", 1, 3, DIRECT, None),
+    (0x36, "STANDBY", 0, 0, ANY, None),
+    (0x41, "PLAY", 1, 1, DIRECT, None),
+    (0x42, "DECK_CONTROL", 1, 1, DIRECT, None),
+    (0x43, "TIMER_CLEARED_STATUS", 1, 1, DIRECT, None),
+    (0x44, "USER_CONTROL_PRESSED", 1, MAX_PARAMETERS, DIRECT, None),
+    (0x45, "USER_CONTROL_RELEASED", 0, 0, DIRECT, None),
+    (0x46, "GIVE_OSD_NAME", 0, 0, DIRECT, 0x47),
+    (0x47, "SET_OSD_NAME", 1, MAX_PARAMETERS, DIRECT, None),
+    (0x64, "SET_OSD_STRING", 2, MAX_PARAMETERS, DIRECT, None),
+    (0x67, "SET_TIMER_PROGRAM_TITLE", 1, MAX_PARAMETERS, DIRECT, None),
+    (0x70, "SYSTEM_AUDIO_MODE_REQUEST", 0, 2, DIRECT, 0x72),
+    (0x71, "GIVE_AUDIO_STATUS", 0, 0, DIRECT, 0x7a),
+    (0x72, "SET_SYSTEM_AUDIO_MODE", 1, 1, ANY, None),
+    (0x7a, "REPORT_AUDIO_STATUS", 1, 1, DIRECT, None),
+    (0x7d, "GIVE_SYSTEM_AUDIO_MODE_STATUS", 0, 0, DIRECT, 0x7e),
+    (0x7e, "SYSTEM_AUDIO_MODE_STATUS", 1, 1, DIRECT, None),
+    (0x80, "ROUTING_CHANGE", 4, 4, BROADCAST, None),
+    (0x81, "ROUTING_INFORMATION", 2, 2, BROADCAST, None),
+    (0x82, "ACTIVE_SOURCE", 2, 2, BROADCAST, None),
+    (0x83, "GIVE_PHYSICAL_ADDRESS", 0, 0, DIRECT, 0x84),
+    (0x84, "REPORT_PHYSICAL_ADDRESS", 3, 3, BROADCAST, None),
+    (0x85, "REQUEST_ACTIVE_SOURCE", 0, 0, BROADCAST, 0x82),
+    (0x86, "SET_STREAM_PATH", 2, 2, BROADCAST, None),
+    (0x87, "DEVICE_VENDOR_ID", 3, 3, BROADCAST, None),
+    (0x89, "VENDOR_COMMAND", 1, MAX_PARAMETERS, DIRECT, None),
+    (0x8a, "VENDOR_REMOTE_BUTTON_DOWN", 1, MAX_PARAMETERS, ANY, None),
+    (0x8b, "VENDOR_REMOTE_BUTTON_UP", 0, 0, ANY, None),
+    (0x8c, "GIVE_DEVICE_VENDOR_ID", 0, 0, DIRECT, 0x87),
+    (0x8d, "MENU_REQUEST", 1, 1, DIRECT, 0x8e),
+    (0x8e, "MENU_STATUS", 1, 1, DIRECT, None),
+    (0x8f, "GIVE_DEVICE_POWER_STATUS", 0, 0, DIRECT, 0x90),
+    (0x90, "REPORT_POWER_STATUS", 1, 1, ANY, None),
+    (0x91, "GET_MENU_LANGUAGE", 0, 0, DIRECT, 0x32),
+    (0x92, "SELECT_ANALOGUE_SERVICE", 4, 4, DIRECT, None),
+    (0x93, "SELECT_DIGITAL_SERVICE", 7, 7, DIRECT, None),
+    (0x97, "SET_DIGITAL_TIMER", 14, 14, DIRECT, 0x35),
+    (0x99, "CLEAR_DIGITAL_TIMER", 14, 14, DIRECT, 0x43),
+    (0x9a, "SET_AUDIO_RATE", 1, 1, DIRECT, None),
+    (0x9d, "INACTIVE_SOURCE", 2, 2, DIRECT, None),
+    (0x9e, "CEC_VERSION", 1, 1, DIRECT, None),
+    (0x9f, "GET_CEC_VERSION", 0, 0, DIRECT, 0x9e),
+    (0xa0, "VENDOR_COMMAND_WITH_ID", 3, MAX_PARAMETERS, ANY, None),
+    (0xa1, "CLEAR_EXTERNAL_TIMER", 9, 10, DIRECT, 0x43),
+    (0xa2, "SET_EXTERNAL_TIMER", 9, 10, DIRECT, 0x35),
+    (0xa3, "REPORT_SHORT_AUDIO_DESCRIPTOR", 3, 12, DIRECT, None),
+    (0xa4, "REQUEST_SHORT_AUDIO_DESCRIPTOR", 1, 4, DIRECT, 0xa3),
+    (0xa5, "GIVE_FEATURES", 0, 0, DIRECT, 0xa6),
+    (0xa6, "REPORT_FEATURES", 4, MAX_PARAMETERS, BROADCAST, None),
+    (0xa7, "REQUEST_CURRENT_LATENCY", 2, 2, BROADCAST, 0xa8),
+    (0xa8, "REPORT_CURRENT_LATENCY", 4, 5, BROADCAST, None),
+    (0xc0, "INITIATE_ARC", 0, 0, DIRECT, None),
+    (0xc1, "REPORT_ARC_INITIATED", 0, 0, DIRECT, None),
+    (0xc2, "REPORT_ARC_TERMINATED", 0, 0, DIRECT, None),
+    (0xc3, "REQUEST_ARC_INITIATION", 0, 0, DIRECT, 0xc0),
+    (0xc4, "REQUEST_ARC_TERMINATION", 0, 0, DIRECT, 0xc5),
+    (0xc5, "TERMINATE_ARC", 0, 0, DIRECT, None),
+    (0xf8, "CDC_MESSAGE", 3, MAX_PARAMETERS, BROADCAST, None),
+    (0xff, "ABORT", 0, 0, DIRECT, 0x00),
+)
+
+
+def _build(specs):
+    table = [None] * 0x100
+    for spec in specs:
+        table[spec[0]] = OpcodeInfo(*spec)
+    return tuple(table)
+
+
+OPCODES = _build(_SPECS)
+
+
+def opcode_info(opcode: int) -> OpcodeInfo:
+    """Metadata of ``opcode``, ``None`` for polls and undefined opcodes."""
+    return None if opcode is None else OPCODES[opcode]
+
+
+def opcode_name(opcode: int) -> str:
+    if opcode is None:
+        return "POLL"
+    info = OPCODES[opcode]
+    return "0x%02x" % opcode if info is None else info.name
+
+
+def reply_opcode(opcode: int) -> int:
+    """Opcode of reply expected to ``opcode`` request or ``None``."""
+    info = opcode_info(opcode)
+    return None if info is None else info.reply
+
+
+def validate(command, addressing=True) -> str:
+    """Return why ``command`` violates opcode metadata or ``None`` if it
+    doesn't. Polls and undefined opcodes are always valid. Direct and
+    broadcast addressing is not checked with ``addressing=False``."""
+    info = opcode_info(command.cmd)
+    if info is None:
+        return None
+    length = len(command.att)
+    if length < info.min_length or length > info.max_length:
+        return "%s takes %d to %d parameters, got %d" % (
+            info.name, info.min_length, info.max_length, length)
+    if not addressing:
+        return None
+    addressed = BROADCAST if command.dst == ADDR_BROADCAST else DIRECT
+    if not info.addressing & addressed:
+        return "%s can't be %s" % (
+            info.name, "broadcast" if addressed == BROADCAST else "direct")
+    return None
+
+
+def describe(command) -> str:
+    """Command with its opcode name for logging."""
+    return "%s (%s)" % (command.raw, opcode_name(command.cmd))
@@ -0,0 +1,195 @@
+"""Wire protocol between pyCEC server and ``TcpAdapter``.
+
+The legacy text protocol sends one colon separated hex frame per line.
+Two character lines are polls and lines starting with ``!`` carry control
+messages. A client may send ``!BINARY 1``; a server supporting it answers
+with the same line and both sides switch to length prefixed binary
+messages::
+
+    length (1 B) | type (1 B) | sequence (2 B) | payload (length - 3 B)
+
+Binary control messages longer than ``MAX_PAYLOAD`` bytes are truncated.
+"""
+import re
+
+from pycec.commands import CecCommand
+
+MSG_FRAME = 0x01
+MSG_POLL_REQUEST = 0x02
+MSG_POLL_RESULT = 0x03
+MSG_ACK = 0x04
+MSG_CONTROL = 0x05
+
+HELLO_BINARY = "BINARY 1"
+
+ACK_OK = 0x00
+ACK_FAILED = 0x01
+
+_LINE_END = re.compile(b'[\r\n]')
+_HEADER_SIZE = 3
+MAX_PAYLOAD = 0xff - _HEADER_SIZE
+
+
+class Message:
+    def __init__(self, kind, seq=0, command: CecCommand = None,
+                 address: int = None, result: bool = None, text: str = None,
+                 status: int = None):
+        self.kind = kind
+        self.seq = seq
+        self.command = command
+        self.address = address
+        self.result = result
+        self.text = text
+        self.status = status
+
+    def __repr__(self):
+        return "Message(%d, seq=%d, command=%s, address=%s, result=%s, " \
+               "text=%s, status=%s)" % (self.kind, self.seq, self.command,
+                                        self.address, self.result,
+                                        self.text, self.status)
+
+
+class TextCodec:
+    """Legacy line based protocol.
+
+    Poll lines are requests when received by the server and positive
+    results when received by a client, there are no negative results,
+    acknowledgements nor sequence numbers.
+    """
+    binary = False
+
+    def __init__(self, server=False):
+        self._server = server
+        self._buffer = b''
+
+    def feed(self, data: bytes):
+        self._buffer += data
+
+    def take_buffer(self) -> bytes:
+        buffer, self._buffer = self._buffer, b''
+        return buffer
+
+    def decode(self):
+        while True:
+            match = _LINE_END.search(self._buffer)
+            if match is None:
+                return
+            end = match.end()
+            if self._buffer[match.start():end + 1] == b'\r\n':
+                end += 1
+            line = self._buffer[:match.start()].decode().strip()
+            self._buffer = self._buffer[end:]
+            if line:
+                yield self._decode_line(line)
+
+    def _decode_line(self, line: str) -> Message:
+        if line.startswith('!'):
+            return Message(MSG_CONTROL, text=line[1:])
+        command = CecCommand(line)
+        if len(line) != 2:
+            return Message(MSG_FRAME, command=command)
+        if self._server:
+            return Message(MSG_POLL_REQUEST, address=command.dst)
+        return Message(MSG_POLL_RESULT, address=command.src, result=True)
+
+    @staticmethod
+    def encode_frame(command: CecCommand, seq=0) -> bytes:
+        return ("%s\r\n" % command.raw).encode()
+
+    @staticmethod
+    def encode_poll_request(address: int, seq=0) -> bytes:
+        return ("f%x\r\n" % address).encode()
+
+    @staticmethod
+    def encode_poll_result(address: int, result: bool, initiator: int,
+                           seq=0) -> bytes:
+        return ("%x%x\r\n" % (address, initiator)).encode() if result else b''
+
+    @staticmethod
+    def encode_ack(seq, status=ACK_OK) -> bytes:
+        return b''
+
+    @staticmethod
+    def encode_control(text: str, seq=0) -> bytes:
+        return ("!%s\r\n" % text).encode()
+
+
+class BinaryCodec:
+    binary = True
+
+    def __init__(self, server=False):
+        self._server = server
+        self._buffer = b''
+
+    def feed(self, data: bytes):
+        self._buffer += data
+
+    def take_buffer(self) -> bytes:
+        buffer, self._buffer = self._buffer, b''
+        return buffer
+
+    def decode(self):
+        while self._buffer and len(self._buffer) > self._buffer[0]:
+            size = self._buffer[0]
+            if size < _HEADER_SIZE:
+                raise ValueError("Invalid message length %d" % size)
+            data = self._buffer[1:size + 1]
+            self._buffer = self._buffer[size + 1:]
+            yield _decode_message(data[0], data[1] << 8 | data[2], data[3:])
+
+    @staticmethod
+    def encode_frame(command: CecCommand, seq=0) -> bytes:
+        header = (0xf if command.src is None else command.src) << 4 | (
+            0xf if command.dst is None else command.dst)
+        payload = [header] if command.cmd is None else [
+            header, command.cmd] + list(command.att)
+        return _pack(MSG_FRAME, seq, payload)
+
+    @staticmethod
+    def encode_poll_request(address: int, seq=0) -> bytes:
+        return _pack(MSG_POLL_REQUEST, seq, (address,))
+
+    @staticmethod
+    def encode_poll_result(address: int, result: bool, initiator: int,
+                           seq=0) -> bytes:
+        return _pack(MSG_POLL_RESULT, seq, (address, int(bool(result))))
+
+    @staticmethod
+    def encode_ack(seq, status=ACK_OK) -> bytes:
+        return _pack(MSG_ACK, seq, (status,))
+
+    @staticmethod
+    def encode_control(text: str, seq=0) -> bytes:
+        data = text.encode()
+        if len(data) > MAX_PAYLOAD:
+            # don't split a multibyte character
+            data = data[:MAX_PAYLOAD].decode(errors='ignore').encode()
+        return _pack(MSG_CONTROL, seq, data)
+
+
+def _pack(kind, seq, payload) -> bytes:
+    payload = bytes(payload)
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Payload of %d bytes doesn't fit a message" %
+                         len(payload))
+    return bytes((len(payload) + _HEADER_SIZE, kind, seq >> 8 & 0xff,
+                  seq & 0xff)) + payload
+
+
+def _decode_message(kind, seq, payload) -> Message:
+    if kind == MSG_FRAME:
+        return Message(kind, seq, command=CecCommand.from_bytes(payload))
+    if kind == MSG_POLL_REQUEST:
+        return Message(kind, seq, address=payload[0])
+    if kind == MSG_POLL_RESULT:
+        return Message(kind, seq, address=payload[0], result=bool(payload[1]))
+    if kind == MSG_ACK:
+        return Message(kind, seq, status=payload[0])
+    if kind == MSG_CONTROL:
+        return Message(kind, seq, text=payload.decode())
+    raise ValueError("Unknown message type %d" % kind)
+
+
+def next_seq(seq: int) -> int:
+    """Next 16 bit sequence number, zero is reserved for unsolicited ones."""
+    return seq % 0xffff + 1
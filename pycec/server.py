@@ -0,0 +1,453 @@
+"""TCP server bridging HDMI network to remote clients."""
+import asyncio
+import collections
+import functools
+import time
+
+from pycec import _LOGGER
+from pycec.commands import CecCommand
+from pycec.const import CMD_POWER_STATUS, CMD_OSD_NAME, CMD_VENDOR, \
+    CMD_PHYSICAL_ADDRESS, CMD_AUDIO_STATUS, CMD_DECK_STATUS, \
+    STATUS_REQUEST_ONCE
+from pycec.network import HDMINetwork
+from pycec.protocol import TextCodec, BinaryCodec, HELLO_BINARY, \
+    MSG_FRAME, MSG_POLL_REQUEST, MSG_CONTROL, ACK_OK, ACK_FAILED
+from pycec.tcp import CoalescingWriter, set_nodelay
+
+DEFAULT_QUEUE_SIZE = 256
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+DEFAULT_SLOW_CLIENT_POLICY = POLICY_DROP
+DEFAULT_MAX_AGE = 60
+DEFAULT_POLL_REUSE = 1
+DEFAULT_HISTORY_SIZE = 64
+
+CONTROL_FILTER = "FILTER"
+CONTROL_SNAPSHOT = "SNAPSHOT"
+ECHO_LIMIT = 32
+
+# Reply opcode and its payload built from cached device state by request
+CACHED_REPLIES = {
+    CMD_POWER_STATUS[0]: (CMD_POWER_STATUS[1], lambda d: [d.power_status]),
+    CMD_OSD_NAME[0]: (CMD_OSD_NAME[1], lambda d: [ord(c) for c in
+                                                  d.osd_name]),
+    CMD_VENDOR[0]: (CMD_VENDOR[1], lambda d: [d.vendor_id >> 16 & 0xff,
+                                              d.vendor_id >> 8 & 0xff,
+                                              d.vendor_id & 0xff]),
+    CMD_PHYSICAL_ADDRESS[0]: (CMD_PHYSICAL_ADDRESS[1], lambda d: (
+        d.physical_address.asattr + [d.type])),
+    CMD_AUDIO_STATUS[0]: (CMD_AUDIO_STATUS[1], lambda d: [
+        int(d.mute_status) << 7 | d.volume_status]),
+    CMD_DECK_STATUS[0]: (CMD_DECK_STATUS[1], lambda d: [d.status]),
+}
+
+
+class ClientStats:
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self.pauses = 0
+        self.max_queued = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def __str__(self):
+        return "sent %d, dropped %d, paused %d times, max queued %d, " \
+               "lag %.3f s (max %.3f s)" % (self.sent, self.dropped,
+                                            self.pauses, self.max_queued,
+                                            self.last_lag, self.max_lag)
+
+
+class FrameFilter:
+    """Subscription of a client to a subset of frames.
+
+    Parsed from control message arguments ``[src=<list>] [dst=<list>]
+    [op=<list>] [changes]`` where list is comma separated hex values or
+    ranges like ``80-8f`` and ``*`` matches anything. With ``changes`` only
+    frames with a payload different from the last one sent to the client
+    from the same source with the same opcode pass.
+    """
+
+    def __init__(self, src_mask=0xffff, dst_mask=0xffff, opcodes=None,
+                 changes_only=False):
+        self.src_mask = src_mask
+        self.dst_mask = dst_mask
+        self.opcodes = opcodes
+        self.changes_only = changes_only
+
+    @classmethod
+    def parse(cls, args: str):
+        result = cls()
+        for token in args.split():
+            key, _, value = token.lower().partition('=')
+            if key == 'changes' and not value:
+                result.changes_only = True
+            elif key == 'src':
+                result.src_mask = _mask(_parse_values(value, 0xf))
+            elif key == 'dst':
+                result.dst_mask = _mask(_parse_values(value, 0xf))
+            elif key == 'op':
+                values = _parse_values(value, 0xff)
+                result.opcodes = None if len(values) == 0x100 else values
+            else:
+                raise ValueError("Unknown filter argument %s" % token)
+        return result
+
+    def matches(self, command, changed=True) -> bool:
+        src = 0xf if command.src is None else command.src
+        dst = 0xf if command.dst is None else command.dst
+        return bool((self.src_mask >> src) & (self.dst_mask >> dst) & 1) and (
+            changed or not self.changes_only)
+
+
+class CECServerProtocol(asyncio.Protocol):
+    """Connection of one client.
+
+    Data is written straight to the transport until it asks to pause
+    writing. Meanwhile messages wait in a bounded queue; once the queue is
+    full the server's slow client policy either drops the oldest messages
+    or disconnects the client.
+    """
+
+    def __init__(self, server):
+        self._server = server
+        self.transport = None
+        self.writer = None
+        self.codec = None
+        self.peer = None
+        self.stats = ClientStats()
+        self.filters = []
+        # (src, opcode) -> last payload sent, kept for changes filters only
+        self.last_payload = dict()
+        self._queue = collections.deque()
+        self._paused = False
+
+    def connection_made(self, transport):
+        self.peer = transport.get_extra_info('peername')
+        _LOGGER.info("Connection opened by %s", self.peer)
+        self.transport = transport
+        set_nodelay(transport)
+        self.writer = CoalescingWriter(self._server.loop, transport)
+        self.codec = TextCodec(server=True)
+        self._server.clients.add(self)
+        self._server.update_routes()
+
+    def data_received(self, data):
+        self.codec.feed(data)
+        codec = None
+        while codec is not self.codec:
+            codec = self.codec
+            for message in codec.decode():
+                self._handle_message(message)
+
+    def _handle_message(self, message):
+        if message.kind == MSG_POLL_REQUEST:
+            _LOGGER.debug("Received poll %s from %s", message.address,
+                          self.peer)
+            self._server.poll(self, message)
+        elif message.kind == MSG_FRAME:
+            _LOGGER.debug("Received command %s from %s", message.command,
+                          self.peer)
+            reply = self._server.cached_reply(message.command)
+            if reply is None:
+                self._server.transmit(self, message)
+            else:
+                _LOGGER.debug("Answering %s from cache", message.command)
+                self.send(self.codec.encode_frame(reply))
+                self.send(self.codec.encode_ack(message.seq))
+        elif message.kind == MSG_CONTROL:
+            self._handle_control(message.text)
+        else:
+            _LOGGER.warning("Unsupported message %s from %s", message,
+                            self.peer)
+
+    def _handle_control(self, text):
+        verb, _, args = text.partition(' ')
+        verb = verb.upper()
+        if text == HELLO_BINARY:
+            _LOGGER.info("Switching %s to binary protocol", self.peer)
+            self.send(self.codec.encode_control(HELLO_BINARY))
+            codec = BinaryCodec(server=True)
+            codec.feed(self.codec.take_buffer())
+            self.codec = codec
+        elif verb == CONTROL_FILTER:
+            self._handle_filter(args.strip())
+        elif verb == CONTROL_SNAPSHOT:
+            self._handle_snapshot(args.strip())
+        else:
+            _LOGGER.warning("Unsupported control message %s from %s", text,
+                            self.peer)
+
+    def _handle_filter(self, args):
+        try:
+            if args.upper() == 'CLEAR':
+                self.filters = []
+            else:
+                self.filters.append(FrameFilter.parse(args))
+        except ValueError as e:
+            _LOGGER.warning("Invalid filter %s from %s: %s",
+                            _shorten(args), self.peer, _shorten(str(e)))
+            self.send(self.codec.encode_control(
+                "%s ERROR %s" % (CONTROL_FILTER, _shorten(str(e)))))
+            return
+        _LOGGER.debug("Client %s filters %s", self.peer, args)
+        self._server.update_routes()
+        self.send(self.codec.encode_control("%s OK" % CONTROL_FILTER))
+
+    def _handle_snapshot(self, args):
+        try:
+            max_age = float(args) if args else None
+        except ValueError:
+            self.send(self.codec.encode_control(
+                "%s ERROR Invalid age %s" % (CONTROL_SNAPSHOT,
+                                             _shorten(args))))
+            return
+        _LOGGER.debug("Sending snapshot to %s", self.peer)
+        self._server.send_snapshot(self, max_age)
+        self.send(self.codec.encode_control("%s END" % CONTROL_SNAPSHOT))
+
+    def wants(self, command) -> bool:
+        return not self.filters or any(
+            f.matches(command) and (f.opcodes is None or
+                                    command.cmd in f.opcodes)
+            for f in self.filters)
+
+    def send(self, data: bytes):
+        if not data or self.transport.is_closing():
+            return
+        if not self._paused:
+            self.writer.write(data)
+            self.stats.sent += 1
+            return
+        if len(self._queue) >= self._server.queue_size:
+            if self._server.slow_client_policy == POLICY_DISCONNECT:
+                _LOGGER.warning("Client %s is too slow, disconnecting. %s",
+                                self.peer, self.stats)
+                self.transport.abort()
+                return
+            self._queue.popleft()
+            self.stats.dropped += 1
+        self._queue.append((self._server.loop.time(), data))
+        self.stats.max_queued = max(self.stats.max_queued, len(self._queue))
+
+    def pause_writing(self):
+        _LOGGER.debug("Client %s paused writing", self.peer)
+        self._paused = True
+        self.stats.pauses += 1
+
+    def resume_writing(self):
+        _LOGGER.debug("Client %s resumed writing", self.peer)
+        self._paused = False
+        if not self._queue:
+            return
+        now = self._server.loop.time()
+        self.stats.last_lag = now - self._queue[0][0]
+        self.stats.max_lag = max(self.stats.max_lag, self.stats.last_lag)
+        while self._queue and not self._paused:
+            self.send(self._queue.popleft()[1])
+
+    def connection_lost(self, exc):
+        _LOGGER.info("Connection with %s lost. %s", self.peer, self.stats)
+        self._server.clients.discard(self)
+        self._server.update_routes()
+        self._queue.clear()
+
+
+class CecServer:
+    def __init__(self, network: HDMINetwork, loop=None,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 slow_client_policy=DEFAULT_SLOW_CLIENT_POLICY,
+                 max_age=DEFAULT_MAX_AGE, poll_reuse=DEFAULT_POLL_REUSE,
+                 history_size=DEFAULT_HISTORY_SIZE):
+        self.network = network
+        self.loop = loop or asyncio.get_event_loop()
+        self.queue_size = queue_size
+        self.slow_client_policy = slow_client_policy
+        self.max_age = max_age
+        self.poll_reuse = poll_reuse
+        self.clients = set()
+        self._unfiltered = set()
+        self._routes = dict()
+        self._any_opcode_routes = []
+        self._polls = dict()
+        self._poll_results = dict()
+        self._history = collections.deque(maxlen=history_size)
+
+    def create_protocol(self):
+        return CECServerProtocol(self)
+
+    def transmit(self, client: CECServerProtocol, request):
+        """Send client's frame to the bus and acknowledge the result."""
+        task = self.loop.create_task(
+            self.network.async_send_command(request.command))
+        task.add_done_callback(
+            functools.partial(self._after_transmit, client, request))
+
+    def _after_transmit(self, client, request, f):
+        failed = f.cancelled() or f.exception() is not None or \
+            f.result() is False
+        if client in self.clients:
+            client.send(client.codec.encode_ack(
+                request.seq, ACK_FAILED if failed else ACK_OK))
+
+    def poll(self, client: CECServerProtocol, request):
+        """Poll device, sharing in-flight and recent polls among clients."""
+        address = request.address
+        recent = self._recent_poll(address)
+        if recent is not None:
+            _LOGGER.debug("Reusing poll result of %d", address)
+            client.send(client.codec.encode_poll_result(
+                address, recent,
+                self.network._adapter.get_logical_address(), request.seq))
+            return
+        self._start_poll(address)[1].append((client, request))
+
+    def poll_device(self, address: int):
+        """Poll device for the network's own scans, sharing polls with
+        clients."""
+        recent = self._recent_poll(address)
+        if recent is not None:
+            future = self.loop.create_future()
+            future.set_result(recent)
+            return future
+        return self._start_poll(address)[0]
+
+    def _recent_poll(self, address):
+        recent = self._poll_results.get(address)
+        if recent and self.loop.time() - recent[0] < self.poll_reuse:
+            return recent[1]
+        return None
+
+    def _start_poll(self, address):
+        poll = self._polls.get(address)
+        if poll is None:
+            task = self.network._adapter.poll_device(address)
+            poll = self._polls[address] = (task, [])
+            task.add_done_callback(functools.partial(self._after_poll,
+                                                     address))
+        return poll
+
+    def _after_poll(self, address, f):
+        result = not f.cancelled() and f.exception() is None and f.result()
+        self._poll_results[address] = (self.loop.time(), result)
+        _, waiting = self._polls.pop(address)
+        initiator = self.network._adapter.get_logical_address()
+        for client, request in waiting:
+            if client in self.clients:
+                client.send(client.codec.encode_poll_result(
+                    address, result, initiator, request.seq))
+        if result and waiting:
+            for c in self.clients - {client for client, _ in waiting}:
+                c.send(c.codec.encode_poll_result(address, result,
+                                                  initiator))
+
+    def cached_reply(self, command: CecCommand):
+        """Reply to status request from device cache if not older than
+        ``max_age``, ``None`` if the request has to go to the bus."""
+        cached = CACHED_REPLIES.get(command.cmd)
+        if cached is None or command.dst is None:
+            return None
+        if command.cmd == CMD_DECK_STATUS[0] and \
+                list(command.att[:1]) != [STATUS_REQUEST_ONCE]:
+            # turning reporting on or off is up to the device
+            return None
+        device = self.network.get_device(command.dst)
+        if device is None:
+            return None
+        updated = device.last_update(command.cmd)
+        if updated is None or time.monotonic() - updated > self.max_age:
+            return None
+        return CecCommand(cached[0], 0xf if command.src is None else
+                          command.src, command.dst, cached[1](device))
+
+    def update_routes(self):
+        """Compile client filters into routes indexed by opcode."""
+        self._unfiltered = set()
+        self._routes = dict()
+        self._any_opcode_routes = []
+        for c in self.clients:
+            if not c.filters:
+                self._unfiltered.add(c)
+            for f in c.filters:
+                if f.opcodes is None:
+                    self._any_opcode_routes.append((c, f))
+                else:
+                    for opcode in f.opcodes:
+                        self._routes.setdefault(opcode, []).append((c, f))
+
+    def _route(self, command):
+        routes = self._routes.get(command.cmd, [])
+        if not routes and not self._any_opcode_routes:
+            return self._unfiltered
+        key = (command.src, command.cmd)
+        payload = tuple(command.att)
+        targets = set(self._unfiltered)
+        for c, f in routes + self._any_opcode_routes:
+            if c not in targets and f.matches(
+                    command, c.last_payload.get(key) != payload):
+                targets.add(c)
+        for c in targets:
+            if any(f.changes_only for f in c.filters):
+                c.last_payload[key] = payload
+        return targets
+
+    def send_snapshot(self, client: CECServerProtocol, max_age=None):
+        """Send recent frames followed by current state of known devices.
+
+        History comes first so that frames rebuilt from the device cache
+        leave the client with current state.
+        """
+        now = self.loop.time()
+        for t, command in self._history:
+            if (max_age is None or now - t <= max_age) and \
+                    client.wants(command):
+                client.send(client.codec.encode_frame(command))
+        initiator = self.network._adapter.get_logical_address()
+        for device in self.network.devices:
+            client.send(client.codec.encode_poll_result(
+                device.logical_address, True, initiator))
+            for cmd, (reply, payload) in CACHED_REPLIES.items():
+                if device.last_update(cmd) is None:
+                    continue
+                command = CecCommand(reply, 0xf, device.logical_address,
+                                     payload(device))
+                if client.wants(command):
+                    client.send(client.codec.encode_frame(command))
+
+    def send_command(self, command):
+        self._history.append((self.loop.time(), command))
+        targets = self._route(command)
+        _LOGGER.debug("Sending %s to %d clients", command, len(targets))
+        encoded = dict()
+        for c in targets:
+            data = encoded.get(type(c.codec))
+            if data is None:
+                data = encoded[type(c.codec)] = c.codec.encode_frame(command)
+            c.send(data)
+
+    def log_stats(self):
+        for c in self.clients:
+            _LOGGER.debug("Client %s: %s", c.peer, c.stats)
+
+
+def _parse_values(value: str, maximum: int) -> set:
+    result = set()
+    for item in value.split(','):
+        if item == '*':
+            return set(range(maximum + 1))
+        low, _, high = item.partition('-')
+        low = int(low, 16)
+        high = int(high, 16) if high else low
+        if not 0 <= low <= high <= maximum:
+            raise ValueError("Invalid range %s" % item)
+        result.update(range(low, high + 1))
+    return result
+
+
+def _shorten(text: str, limit=ECHO_LIMIT) -> str:
+    """Client input echoed in replies and logs, cut to ``limit``."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _mask(values) -> int:
+    return sum(1 << v for v in values)
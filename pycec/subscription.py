@@ -0,0 +1,100 @@
+"""Asynchronous iteration over inbound commands."""
+import collections
+
+from pycec.commands import CecCommand
+
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_BLOCK = "block"
+DEFAULT_SUBSCRIPTION_SIZE = 64
+DEFAULT_SUBSCRIPTION_BACKLOG = 1024
+
+
+class CommandSubscription:
+    """Bounded queue of inbound commands consumed by ``async for``.
+
+    Commands rejected by ``predicate`` are never queued. When the queue is
+    full ``overflow`` decides whether the oldest or the newest command is
+    dropped (and counted in ``dropped``) or whether commands wait in the
+    subscription's own backlog until the consumer catches up. The network
+    never waits for a subscriber; only once ``backlog`` commands are queued
+    the oldest are dropped even when blocking.
+    """
+
+    def __init__(self, loop, predicate: callable = None,
+                 maxsize=DEFAULT_SUBSCRIPTION_SIZE,
+                 overflow=OVERFLOW_DROP_OLDEST, on_close: callable = None,
+                 backlog=DEFAULT_SUBSCRIPTION_BACKLOG):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST,
+                            OVERFLOW_BLOCK):
+            raise ValueError("Unknown overflow policy %s" % overflow)
+        self._loop = loop
+        self._predicate = predicate
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._on_close = on_close
+        self._backlog = max(backlog, maxsize)
+        self._queue = collections.deque()
+        self._waiter = None
+        self._closed = False
+        self.dropped = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self._queue) >= self._maxsize
+
+    @property
+    def blocking(self) -> bool:
+        """Whether commands wait in the backlog for the consumer."""
+        return self._overflow == OVERFLOW_BLOCK and \
+            len(self._queue) > self._maxsize
+
+    def offer(self, command: CecCommand):
+        if self._closed or (self._predicate and not self._predicate(command)):
+            return
+        limit = self._backlog if self._overflow == OVERFLOW_BLOCK else \
+            self._maxsize
+        if len(self._queue) >= limit:
+            self.dropped += 1
+            if self._overflow == OVERFLOW_DROP_NEWEST:
+                return
+            self._queue.popleft()
+        self._queue.append(command)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self) -> CecCommand:
+        """Next command, raises ``StopAsyncIteration`` once closed."""
+        while not self._queue:
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        if self._on_close:
+            self._on_close(self)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> CecCommand:
+        return await self.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,88 +1,236 @@
 import asyncio
+import collections
 import functools
 import logging
+import random
+import socket
 import time
 
 from pycec.commands import CecCommand, KeyPressCommand, KeyReleaseCommand, \
     PollCommand
 from pycec.const import CMD_STANDBY, KEY_POWER
-from pycec.network import AbstractCecAdapter, HDMINetwork
+from pycec.network import AbstractCecAdapter, HDMINetwork, \
+    CONNECTION_CONNECTED, CONNECTION_CONNECTING, CONNECTION_DISCONNECTED
+from pycec.protocol import TextCodec, BinaryCodec, HELLO_BINARY, \
+    MSG_FRAME, MSG_POLL_RESULT, MSG_ACK, MSG_CONTROL, ACK_OK, next_seq
 
 DEFAULT_PORT = 9526
 MAX_CONNECTION_ATTEMPTS = 5
 CONNECTION_ATTEMPT_DELAY = 3
+MAX_CONNECTION_ATTEMPT_DELAY = 60
+CONNECTION_TIMEOUT = 10
+STABLE_CONNECTION = 30
+NEGOTIATION_TIMEOUT = 2
+NEGOTIATION_ATTEMPTS = 2
+OUTBOUND_BUFFER_SIZE = 64
+OUTBOUND_EXPIRY = 10
+SNAPSHOT_POLL_EXPIRY = 10
 _LOGGER = logging.getLogger(__name__)
 
 
 # pragma: no cover
 class TcpAdapter(AbstractCecAdapter):
     def __init__(self, host, port=DEFAULT_PORT, name=None,
-                 activate_source=None):
+                 activate_source=None, buffer_size=OUTBOUND_BUFFER_SIZE,
+                 command_expiry=OUTBOUND_EXPIRY, binary=False,
+                 filters=None, snapshot=False):
         super().__init__()
         self._polling = dict()
+        self._poll_seqs = dict()
+        self._acks = dict()
+        self._seq = 0
+        self._binary = binary
+        self._filters = list(filters or [])
+        self._snapshot = snapshot
+        self._snapshot_polls = dict()
+        self._receiving_snapshot = False
+        self._codec = TextCodec()
+        self._negotiation = None
+        # connections closed by the server while negotiating, in a row
+        self._rejections = 0
         self._command_callback = None
-        self._tcp_loop = asyncio.new_event_loop()
         self._host = host
         self._port = port
         self._transport = None
+        self._writer = None
         self._osd_name = name
         self._activate_source = activate_source
+        self._outbound = collections.deque(maxlen=buffer_size)
+        self._command_expiry = command_expiry
+        self._connector = None
+        self._closing = False
+        # connections attempted since the last one which stayed up
+        self._attempt = 0
+        self._stable = None
 
     def _after_init(self, callback, f):
-        if self._transport:
+        if not f.cancelled() and f.result():
             _LOGGER.debug("New client: %s", self._transport)
-            self._initialized = True
-            self._tcp_loop.run_in_executor(None, self._tcp_loop.run_forever)
         if callback:
             callback()
 
-    def _init(self):
-        for i in range(0, MAX_CONNECTION_ATTEMPTS):
+    async def _async_connect(self, attempts=None):
+        """Connect with jittered exponential backoff.
+
+        Backoff continues across connections which are lost before staying
+        up for ``STABLE_CONNECTION`` seconds, so a server closing
+        connections right away isn't flooded with them. Gives up after
+        ``attempts`` failures or retries forever if ``None``.
+        """
+        self._set_connection_state(CONNECTION_CONNECTING)
+        failures = 0
+        while not self._closing:
+            if self._attempt:
+                delay = _backoff_delay(self._attempt)
+                _LOGGER.debug("Connecting in %.1f seconds.", delay)
+                await asyncio.sleep(delay)
+            self._attempt += 1
             try:
-                self._transport, protocol = self._tcp_loop.run_until_complete(
-                    self._tcp_loop.create_connection(lambda: TcpProtocol(self),
-                                                     host=self._host,
-                                                     port=self._port))
+                await asyncio.wait_for(
+                    self._loop.create_connection(lambda: TcpProtocol(self),
+                                                 host=self._host,
+                                                 port=self._port),
+                    CONNECTION_TIMEOUT)
                 _LOGGER.debug("Connection started.")
-                break
-            except (ConnectionRefusedError, RuntimeError) as e:
-                _LOGGER.warning(
-                    "Unable to connect due to %s. Trying again in %d seconds, "
-                    "%d attempts remaining.",
-                    e, CONNECTION_ATTEMPT_DELAY, MAX_CONNECTION_ATTEMPTS - i)
-                time.sleep(CONNECTION_ATTEMPT_DELAY)
-        else:
-            _LOGGER.error("Unable to connect! Giving up.")
-            self.shutdown()
+                return True
+            except (OSError, asyncio.TimeoutError) as e:
+                failures += 1
+                if attempts is not None and failures >= attempts:
+                    _LOGGER.error("Unable to connect due to %s! Giving up.",
+                                  e)
+                    break
+                _LOGGER.warning("Unable to connect due to %s.", e)
+        self._set_connection_state(CONNECTION_DISCONNECTED)
+        return False
+
+    def _connection_stable(self):
+        self._stable = None
+        # the next reconnect still waits for the shortest delay
+        self._attempt = 1
 
     def init(self, callback: callable = None):
         _LOGGER.debug("Starting connection...")
-        task = self._loop.run_in_executor(None, self._init)
+        self._closing = False
+        self._attempt = 0
+        task = self._loop.create_task(
+            self._async_connect(MAX_CONNECTION_ATTEMPTS))
         task.add_done_callback(functools.partial(self._after_init, callback))
+        self._connector = task
         return task
 
     def shutdown(self):
+        self._closing = True
         self._initialized = False
-        if self._transport and not self._transport.is_closing():
-            self._transport.close()
-        self._transport = None
+        if not self._loop.is_closed():
+            if self._connector and not self._connector.done():
+                self._connector.cancel()
+            if self._stable:
+                self._stable.cancel()
+        self._stable = None
+        transport = self._transport
+        self.set_transport(None)
+        if transport and not transport.is_closing() and \
+                not self._loop.is_closed():
+            transport.close()
+        self._set_connection_state(CONNECTION_DISCONNECTED)
+
+    def _connection_made(self, transport):
+        set_nodelay(transport)
+        self.set_transport(transport)
+        self._codec = TextCodec()
+        if self._binary:
+            _LOGGER.debug("Negotiating binary protocol.")
+            self._writer.write(self._codec.encode_control(HELLO_BINARY))
+            self._negotiation = self._loop.call_later(
+                NEGOTIATION_TIMEOUT, self._negotiation_failed, transport)
+        else:
+            self._negotiated()
 
-    def _poll_device(self, device):
+    def _negotiated(self):
+        if self._negotiation:
+            self._negotiation.cancel()
+            self._negotiation = None
+        self._rejections = 0
+        self._initialized = True
+        self._stable = self._loop.call_later(STABLE_CONNECTION,
+                                             self._connection_stable)
+        for f in self._filters:
+            self._writer.write(self._codec.encode_control("FILTER %s" % f))
+        if self._snapshot:
+            self._receiving_snapshot = True
+            self._snapshot_polls = dict()
+            self._writer.write(self._codec.encode_control("SNAPSHOT"))
+        self._set_connection_state(CONNECTION_CONNECTED)
+        self._replay_outbound()
+
+    def _negotiation_failed(self, transport):
+        self._negotiation = None
+        if transport is not self._transport:
+            return
+        self._fall_back()
+        transport.close()
+
+    def _fall_back(self):
+        _LOGGER.warning("Server did not accept binary protocol. Falling back "
+                        "to text protocol.")
+        self._binary = False
+
+    def _connection_lost(self):
+        self.set_transport(None)
+        if self._stable:
+            self._stable.cancel()
+            self._stable = None
+        for ack in self._acks.values():
+            if not ack.done():
+                ack.set_result(None)
+        self._acks.clear()
+        if self._negotiation:
+            self._negotiation.cancel()
+            self._negotiation = None
+            # servers without binary support drop the connection on the
+            # hello, but so does a flaky network now and then
+            self._rejections += 1
+            if self._rejections >= NEGOTIATION_ATTEMPTS:
+                self._fall_back()
+        if self._closing:
+            return
+        self._set_connection_state(CONNECTION_DISCONNECTED)
+        if self._connector is None or self._connector.done():
+            _LOGGER.warning("Connection lost. Trying to reconnect...")
+            self._connector = self._loop.create_task(self._async_connect())
+
+    def _replay_outbound(self):
+        expired = self._loop.time() - self._command_expiry
+        while self._outbound and self._transport:
+            queued, command = self._outbound.popleft()
+            if queued < expired:
+                _LOGGER.debug("Dropping expired command %s", command)
+                continue
+            self.transmit(command)
+
+    async def _async_poll_device(self, device):
+        if device in self._snapshot_polls:
+            return self._snapshot_polls.pop(device)
+        future = self._polling.get(device)
+        if future is None or future.done():
+            future = self._loop.create_future()
+            self._polling[device] = future
         req = self._loop.time()
-        poll_bucket = self._polling.get(device, set())
-        poll_bucket.add(req)
-        self._polling.update({device: poll_bucket})
         self.transmit(PollCommand(device))
-        while True:
-            if req not in self._polling.get(device, set()):
-                _LOGGER.debug("Found device %d.", device)
-                return True
-            if self._loop.time() > (req + 5):
-                return False
-            time.sleep(.1)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future),
+                                            self._poll_times.timeout(device))
+        except asyncio.TimeoutError:
+            if self._polling.get(device) is future:
+                del self._polling[device]
+            return False
+        if result:
+            self._poll_times.add(device, self._loop.time() - req)
+            _LOGGER.debug("Found device %d.", device)
+        return result
 
     def poll_device(self, device):
-        return self._loop.run_in_executor(None, self._poll_device, device)
+        return self._loop.create_task(self._async_poll_device(device))
 
     def get_logical_address(self):
         return 0xf
@@ -91,7 +239,66 @@ class TcpAdapter(AbstractCecAdapter):
         self.transmit(CecCommand(CMD_STANDBY))
 
     def transmit(self, command: CecCommand):
-        self._transport.write(("%s\r\n" % command.raw).encode())
+        if self._transport is None or self._transport.is_closing() or \
+                self._connection_state != CONNECTION_CONNECTED:
+            if command.cmd is not None:
+                if len(self._outbound) == self._outbound.maxlen:
+                    _LOGGER.debug("Outbound buffer full, dropping %s",
+                                  self._outbound[0][1])
+                self._outbound.append((self._loop.time(), command))
+            return
+        self._seq = next_seq(self._seq)
+        if command.cmd is None:
+            self._poll_seqs[command.dst] = self._seq
+            self._writer.write(
+                self._codec.encode_poll_request(command.dst, self._seq))
+        else:
+            self._writer.write(self._codec.encode_frame(command, self._seq))
+            if self._codec.binary:
+                ack = self._loop.create_future()
+                self._acks[self._seq] = ack
+                return ack
+        return None
+
+    def _handle_message(self, message):
+        if message.kind == MSG_FRAME:
+            self._command_callback(message.command)
+        elif message.kind == MSG_POLL_RESULT:
+            if message.seq and \
+                    self._poll_seqs.get(message.address) != message.seq:
+                _LOGGER.debug("Ignoring stale poll result %s", message)
+                return
+            self._poll_seqs.pop(message.address, None)
+            future = self._polling.pop(message.address, None)
+            if future and not future.done():
+                future.set_result(message.result)
+            if self._receiving_snapshot:
+                self._snapshot_polls[message.address] = message.result
+        elif message.kind == MSG_ACK:
+            if message.status != ACK_OK:
+                _LOGGER.debug("Frame %d not acknowledged", message.seq)
+            ack = self._acks.pop(message.seq, None)
+            if ack and not ack.done():
+                ack.set_result(message.status == ACK_OK)
+        elif message.kind == MSG_CONTROL and message.text == HELLO_BINARY \
+                and self._negotiation:
+            _LOGGER.debug("Switching to binary protocol.")
+            codec = BinaryCodec()
+            codec.feed(self._codec.take_buffer())
+            self._codec = codec
+            self._negotiated()
+        elif message.kind == MSG_CONTROL and message.text == "SNAPSHOT END":
+            # Server knows all present devices, the rest is absent. Results
+            # are used once and only by the scan following the snapshot.
+            self._receiving_snapshot = False
+            for address in range(15):
+                self._snapshot_polls.setdefault(address, False)
+            self._loop.call_later(SNAPSHOT_POLL_EXPIRY,
+                                  self._snapshot_polls.clear)
+            _LOGGER.debug("Snapshot received, present devices: %s",
+                          [a for a, r in self._snapshot_polls.items() if r])
+        else:
+            _LOGGER.debug("Ignoring message %s", message)
 
     def set_command_callback(self, callback):
         self._command_callback = callback
@@ -102,44 +309,69 @@ class TcpAdapter(AbstractCecAdapter):
 
     def set_transport(self, transport):
         self._transport = transport
+        self._writer = (None if transport is None else
+                        CoalescingWriter(self._loop, transport))
 
 
 class TcpProtocol(asyncio.Protocol):
-    buffer = ''
-
     def __init__(self, adapter: TcpAdapter):
         self._adapter = adapter
         self.transport = None
 
     def connection_made(self, transport):
         self.transport = transport
-        self._adapter.set_transport = transport
+        self._adapter._connection_made(transport)
 
     def data_received(self, data: bytes):
-        self.buffer += bytes.decode(data)
-        for line in self.buffer.splitlines(keepends=True):
-            if line.count('\n') or line.count('\r'):
-                line = line.rstrip()
-                _LOGGER.debug("Received %s from %s", line,
+        self._adapter._codec.feed(data)
+        codec = None
+        while codec is not self._adapter._codec:
+            codec = self._adapter._codec
+            for message in codec.decode():
+                _LOGGER.debug("Received %s from %s", message,
                               self.transport.get_extra_info('peername'))
-                if len(line) == 2:
-                    cmd = CecCommand(line)
-                    if cmd.src in self._adapter._polling:
-                        del self._adapter._polling[cmd.src]
-                else:
-                    self._adapter._command_callback("<< " + line)
-                self.buffer = ''
-            else:
-                self.buffer = line
+                self._adapter._handle_message(message)
 
     def eof_received(self):
-        self._adapter.shutdown()
+        _LOGGER.debug("Server closed the connection.")
 
     def connection_lost(self, exc):
-        _LOGGER.warning("Connection lost. Trying to reconnect...")
-        self._adapter.shutdown()
-        self._adapter._tcp_loop.stop()
-        self._adapter.init()
+        self._adapter._connection_lost()
+
+
+class CoalescingWriter:
+    """Collect frames written within one loop iteration into one write."""
+
+    def __init__(self, loop, transport):
+        self._loop = loop
+        self._transport = transport
+        self._pending = []
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        if not self._pending:
+            self._loop.call_soon(self.flush)
+        self._pending.append(data)
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if pending and not self._transport.is_closing():
+            self._transport.writelines(pending)
+
+
+def set_nodelay(transport):
+    """Disable Nagle's algorithm, writes are coalesced by the caller."""
+    sock = transport.get_extra_info('socket')
+    if sock is not None and sock.family in (socket.AF_INET,
+                                            socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _backoff_delay(attempt):
+    delay = min(CONNECTION_ATTEMPT_DELAY * 2 ** (attempt - 1),
+                MAX_CONNECTION_ATTEMPT_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
 
 
 def main():
@@ -0,0 +1,71 @@
+"""Round-trip time tracking and adaptive timeouts."""
+import collections
+import math
+
+DEFAULT_TIMEOUT = 5
+MIN_TIMEOUT = 0.5
+MAX_TIMEOUT = 5
+TIMEOUT_PERCENTILE = 95
+TIMEOUT_FACTOR = 2
+TIMEOUT_MARGIN = 0.25
+SAMPLE_WINDOW = 32
+MIN_SAMPLES = 3
+
+
+class RoundTripTimes:
+    """Per-destination round-trip samples with a derived timeout.
+
+    Timeout is the configured percentile of recent samples multiplied by
+    ``factor`` plus ``margin`` and clamped to ``<minimum, maximum>``.
+    Destinations without enough samples of their own fall back to figures
+    of the whole bus and then to ``default``.
+    """
+
+    def __init__(self, default=DEFAULT_TIMEOUT, minimum=MIN_TIMEOUT,
+                 maximum=MAX_TIMEOUT, percentile=TIMEOUT_PERCENTILE,
+                 factor=TIMEOUT_FACTOR, margin=TIMEOUT_MARGIN,
+                 window=SAMPLE_WINDOW):
+        self._default = default
+        self._minimum = minimum
+        self._maximum = maximum
+        self._percentile = percentile
+        self._factor = factor
+        self._margin = margin
+        self._window = window
+        self._samples = dict()
+        self._bus_samples = collections.deque(maxlen=window * 4)
+
+    def add(self, destination: int, rtt: float):
+        samples = self._samples.get(destination)
+        if samples is None:
+            samples = collections.deque(maxlen=self._window)
+            self._samples[destination] = samples
+        samples.append(rtt)
+        self._bus_samples.append(rtt)
+
+    def percentile(self, destination: int = None):
+        samples = self._samples.get(destination, ())
+        if len(samples) < MIN_SAMPLES:
+            samples = self._bus_samples
+        if len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        rank = math.ceil(self._percentile / 100 * len(ordered))
+        return ordered[max(rank, 1) - 1]
+
+    def timeout(self, destination: int = None) -> float:
+        rtt = self.percentile(destination)
+        if rtt is None:
+            return self._default
+        return min(max(rtt * self._factor + self._margin, self._minimum),
+                   self._maximum)
+
+    def reset(self, destination: int = None):
+        if destination is None:
+            self._samples.clear()
+            self._bus_samples.clear()
+        else:
+            self._samples.pop(destination, None)
+
+    def __len__(self):
+        return len(self._bus_samples)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Measure import time of pyCEC modules.
+
+Every module is imported in a fresh interpreter with ``-X importtime``, the
+best of ``--repeat`` runs is reported. Exits with non-zero status when
+modules which must be deferred get imported or when time spent in pyCEC's
+own modules exceeds ``--budget`` milliseconds.
+"""
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+
+MODULES = ("pycec", "pycec.network", "pycec.tcp")
+DEFERRED = ("multiprocessing", "cec", "pycec.cec")
+DEFAULT_REPEAT = 5
+DEFAULT_BUDGET = 25
+
+
+def measure(module):
+    """Return total and own import time in us and names of loaded modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    total = own = 0
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[12:].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        name = name.strip()
+        loaded.add(name)
+        if name == module:
+            total = int(cumulative_us)
+        if name == "pycec" or name.startswith("pycec."):
+            own += int(self_us)
+    return total, own, loaded
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=DEFAULT_REPEAT,
+                      help="Runs per module. Default is '%s'."
+                           % DEFAULT_REPEAT)
+    parser.add_option("-b", "--budget", dest="budget", type="float",
+                      default=DEFAULT_BUDGET,
+                      help=("Milliseconds allowed for pyCEC's own modules. "
+                            "Default is '%s'." % DEFAULT_BUDGET))
+    options, args = parser.parse_args()
+    failed = False
+    print("%-16s %10s %10s" % ("module", "total ms", "pycec ms"))
+    for module in args or MODULES:
+        runs = [measure(module) for _ in range(options.repeat)]
+        total = min(r[0] for r in runs) / 1000
+        own = min(r[1] for r in runs) / 1000
+        print("%-16s %10.1f %10.1f" % (module, total, own))
+        deferred = sorted(runs[0][2].intersection(DEFERRED))
+        if deferred:
+            print("  imports %s" % ", ".join(deferred))
+            failed = True
+        if own > options.budget:
+            print("  over budget of %.1f ms" % options.budget)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
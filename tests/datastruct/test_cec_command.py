@@ -61,3 +61,12 @@ def test_raw():
     assert cc.raw == "2c"
     cc = CecCommand(CMD_POLL, dst=3)
     assert cc.raw == "f3"
+
+
+def test_from_bytes():
+    cc = CecCommand.from_bytes(bytes((0x1f, 0x90, 0x02)))
+    assert cc.raw == "1f:90:02"
+    cc = CecCommand.from_bytes(bytes((0x2c,)))
+    assert cc.raw == "2c"
+    assert cc.src == 2
+    assert cc.dst == 0xc
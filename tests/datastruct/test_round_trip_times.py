@@ -0,0 +1,43 @@
+from pycec.timing import RoundTripTimes
+
+
+def test_default_timeout():
+    rtt = RoundTripTimes(default=5)
+    assert 5 == rtt.timeout(4)
+    rtt.add(4, 0.1)
+    rtt.add(4, 0.1)
+    assert 5 == rtt.timeout(4)
+
+
+def test_percentile():
+    rtt = RoundTripTimes(percentile=50)
+    for i in range(1, 11):
+        rtt.add(4, i / 10)
+    assert 0.5 == rtt.percentile(4)
+    rtt = RoundTripTimes(percentile=95)
+    for i in range(1, 11):
+        rtt.add(4, i / 10)
+    assert 1.0 == rtt.percentile(4)
+
+
+def test_timeout_bounds():
+    rtt = RoundTripTimes(minimum=0.5, maximum=2, factor=2, margin=0.25)
+    for _ in range(3):
+        rtt.add(1, 0.01)
+    assert 0.5 == rtt.timeout(1)
+    for _ in range(3):
+        rtt.add(2, 0.5)
+    assert 1.25 == rtt.timeout(2)
+    for _ in range(3):
+        rtt.add(3, 10)
+    assert 2 == rtt.timeout(3)
+
+
+def test_bus_fallback():
+    rtt = RoundTripTimes(default=5, minimum=0, factor=1, margin=0)
+    for _ in range(3):
+        rtt.add(1, 0.2)
+    assert 0.2 == rtt.timeout(7)
+    rtt.reset()
+    assert 5 == rtt.timeout(7)
+    assert 0 == len(rtt)
@@ -0,0 +1,90 @@
+"""Mock adapters and transports shared by tests."""
+import asyncio
+
+from pycec.commands import CecCommand
+from pycec.const import CMD_POWER_STATUS, CMD_OSD_NAME, CMD_VENDOR, \
+    CMD_PHYSICAL_ADDRESS, CMD_DECK_STATUS, CMD_TUNER_STATUS, CMD_AUDIO_STATUS
+from pycec.network import AbstractCecAdapter
+
+
+class MockAdapter(AbstractCecAdapter):
+    def __init__(self, data):
+        self._data = data
+        self._command_callback = None
+        super().__init__()
+
+    def shutdown(self):
+        pass
+
+    def init(self, callback: callable = None):
+        f = asyncio.Future()
+        f.set_result(True)
+        self._initialized = True
+        return f
+
+    def power_on_devices(self):
+        pass
+
+    def standby_devices(self):
+        pass
+
+    def set_command_callback(self, callback):
+        self._command_callback = callback
+
+    def poll_device(self, i):
+        f = asyncio.Future()
+        f.set_result(self._data[i])
+        return f
+
+    def transmit(self, command):
+        cmd = None
+        att = None
+        if command.cmd == CMD_POWER_STATUS[0]:
+            cmd = CMD_POWER_STATUS[1]
+            att = [2]
+        elif command.cmd == CMD_OSD_NAME[0]:
+            cmd = CMD_OSD_NAME[1]
+            att = (ord(i) for i in ("Test%d" % command.dst))
+        elif command.cmd == CMD_VENDOR[0]:
+            cmd = CMD_VENDOR[1]
+            att = [0x00, 0x09, 0xB0]
+        elif command.cmd == CMD_PHYSICAL_ADDRESS[0]:
+            cmd = CMD_PHYSICAL_ADDRESS[1]
+            att = [0x09, 0xB0, 0x02]
+        elif command.cmd == CMD_DECK_STATUS[0]:
+            cmd = CMD_DECK_STATUS[1]
+            att = [0x09]
+        elif command.cmd == CMD_TUNER_STATUS[0]:
+            cmd = CMD_TUNER_STATUS[1]
+            att = [0x00, 0x00, 0x01, 0x00, 0x01]
+        elif command.cmd == CMD_AUDIO_STATUS[0]:
+            cmd = CMD_AUDIO_STATUS[1]
+            att = [0x65]
+        response = CecCommand(cmd, src=command.dst, dst=command.src, att=att)
+        self._command_callback(">> " + response.raw)
+
+    def get_logical_address(self):
+        return 2
+
+
+class MockTransport(asyncio.Transport):
+    def __init__(self):
+        super().__init__()
+        self.data = b""
+        self.aborted = False
+        self.closed = False
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def writelines(self, list_of_data):
+        self.data += b"".join(list_of_data)
+
+    def is_closing(self):
+        return self.aborted or self.closed
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
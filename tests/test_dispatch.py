@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pycec.dispatch import CallbackDispatcher
+
+
+def test_inline_order_and_coalescing():
+    loop = asyncio.new_event_loop()
+    dispatcher = CallbackDispatcher(maxsize=3)
+    dispatcher.set_event_loop(loop)
+    calls = []
+
+    def update(value):
+        calls.append(("update", value))
+
+    for i in range(3):
+        dispatcher.dispatch(4, update, i, coalesce=True)
+    for i in range(5):
+        dispatcher.dispatch(5, calls.append, i)
+    loop.run_until_complete(asyncio.sleep(0))
+    # callbacks on the network's loop are never dropped
+    assert [("update", 0), 0, 1, 2, 3, 4] == calls
+    assert 2 == dispatcher.coalesced
+    assert 0 == dispatcher.dropped
+    assert 1 == dispatcher.stats[update.__qualname__].calls
+    loop.close()
+
+
+def test_executor_drops_oldest():
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(1)
+    dispatcher = CallbackDispatcher(executor=executor, maxsize=2)
+    dispatcher.set_event_loop(loop)
+    calls = []
+    for i in range(5):
+        dispatcher.dispatch(5, calls.append, i)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    # first one was submitted right away, oldest of the queued are dropped
+    assert [0, 3, 4] == calls
+    assert 2 == dispatcher.dropped
+    executor.shutdown()
+    loop.close()
+
+
+def test_executor_keeps_order_per_key():
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(4)
+    dispatcher = CallbackDispatcher(executor=executor, slow_threshold=1)
+    dispatcher.set_event_loop(loop)
+    calls = []
+
+    def slow(key, value):
+        time.sleep(0.02)
+        calls.append((key, value))
+
+    start = time.monotonic()
+    for i in range(3):
+        for key in (1, 2, 3):
+            dispatcher.dispatch(key, slow, key, i)
+    assert time.monotonic() - start < 0.02
+    loop.run_until_complete(asyncio.sleep(0.2))
+    for key in (1, 2, 3):
+        assert [0, 1, 2] == [v for k, v in calls if k == key]
+    assert 9 == dispatcher.stats[slow.__qualname__].calls
+    assert dispatcher.stats[slow.__qualname__].max >= 0.02
+    executor.shutdown()
+    loop.close()
+
+
+def test_separate_loop():
+    loop = asyncio.new_event_loop()
+    callback_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=callback_loop.run_forever)
+    thread.start()
+    dispatcher = CallbackDispatcher(loop=callback_loop)
+    dispatcher.set_event_loop(loop)
+    threads = []
+    for _ in range(3):
+        dispatcher.dispatch(1, lambda: threads.append(
+            threading.current_thread()))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert [thread] * 3 == threads
+    callback_loop.call_soon_threadsafe(callback_loop.stop)
+    thread.join()
+    callback_loop.close()
+    loop.close()
@@ -108,3 +108,33 @@ def test_update_callback():
     device.update_callback(CecCommand(CMD_VENDOR[1], att=[0x00, 0x80, 0x45]))
     assert 0x008045 == device.vendor_id
     assert "Panasonic" == device.vendor
+
+
+def test_update_flags():
+    device = HDMIDevice(2)
+    assert device.is_updated(CMD_POWER_STATUS[0]) is False
+    assert device.last_update(CMD_POWER_STATUS[0]) is None
+    device.update_callback(CecCommand(CMD_POWER_STATUS[1], att=[0x01]))
+    assert device.is_updated(CMD_POWER_STATUS[0]) is True
+    assert device.is_updated(CMD_VENDOR[0]) is False
+    assert device.last_update(CMD_POWER_STATUS[0]) is not None
+    assert device.is_updated(0x01) is False
+
+
+def test_snapshot():
+    device = HDMIDevice(2)
+    snapshot = device.snapshot
+    assert 0 == snapshot.version
+    device.update_callback(CecCommand(CMD_POWER_STATUS[1], att=[0x01]))
+    assert 1 == device.snapshot.version
+    assert 1 == device.snapshot.power_status
+    assert 0 == snapshot.power_status
+    device.update_callback(CecCommand(CMD_POWER_STATUS[1], att=[0x01]))
+    assert 1 == device.snapshot.version
+    device.update_callback(CecCommand(CMD_PHYSICAL_ADDRESS[1],
+                                      att=[0x11, 0x00, 0x04]))
+    device.update_callback(CecCommand(CMD_PHYSICAL_ADDRESS[1],
+                                      att=[0x11, 0x00, 0x04]))
+    assert 2 == device.snapshot.version
+    assert (0x1100, 4) == (device.snapshot.physical_address.asint,
+                           device.snapshot.type)
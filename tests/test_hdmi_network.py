@@ -1,14 +1,16 @@
 import asyncio
-from pycec.commands import CecCommand
+import logging
+from pycec.commands import CecCommand, KeyPressCommand
 from pycec.const import (
     CMD_POWER_STATUS,
-    CMD_OSD_NAME,
-    CMD_VENDOR,
-    CMD_PHYSICAL_ADDRESS,
     CMD_DECK_STATUS,
     CMD_AUDIO_STATUS,
 )
-from pycec.network import HDMINetwork, HDMIDevice, AbstractCecAdapter
+from pycec.dispatch import CallbackDispatcher
+from pycec.network import HDMINetwork, HDMIDevice, PhysicalAddress, \
+    STATE_POWER, STATE_VOLUME, UNSUPPORTED_RECHECK
+from pycec.timing import RoundTripTimes
+from tests.mocks import MockAdapter
 
 
 def test_devices():
@@ -44,6 +46,7 @@ def test_devices():
     loop.run_until_complete(asyncio.sleep(0.1))
     loop.stop()
     loop.run_forever()
+    assert network.init_time < 0.1
     for i in [0, 1, 3, 5]:
         assert HDMIDevice(i) in network.devices
     for i in [2, 4, 6, 7, 8, 9, 10, 11, 12, 13, 14]:
@@ -105,6 +108,9 @@ def test_scan():
     device = network.get_device(3)
     assert "Test3" == device.osd_name
     assert 2 == device.power_status
+
+    assert len(network._adapter.reply_times) > 0
+    assert not network._pending_replies
     for d in network.devices:
         d.stop()
     network.stop()
@@ -112,58 +118,436 @@ def test_scan():
     loop.run_forever()
 
 
-class MockAdapter(AbstractCecAdapter):
+def test_batched_callbacks():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop, inbound_queue_size=4)
+    wakeups = []
+    call_soon_threadsafe = loop.call_soon_threadsafe
+
+    def count_wakeups(callback, *args):
+        wakeups.append(callback)
+        return call_soon_threadsafe(callback, *args)
+
+    loop.call_soon_threadsafe = count_wakeups
+    commands = []
+    network.set_command_callback(commands.append)
+    for i in range(6):
+        network.command_callback(">> 4f:82:%02x:00" % i)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert 1 == len(wakeups)
+    assert [0x02, 0x03, 0x04, 0x05] == [c.att[0] for c in commands]
+    assert 2 == network.inbound_dropped
+    network.command_callback(">> 4f:36")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert 2 == len(wakeups)
+    loop.close()
+
+
+def test_structured_callbacks():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop)
+    commands = []
+    network.set_command_callback(commands.append)
+    key_press = KeyPressCommand(0x41)
+    network.command_callback(key_press)
+    network.command_callback(">> 4f:82:10:00")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert key_press is commands[0]
+    assert (4, 0xf, 0x82, [0x10, 0x00]) == (
+        commands[1].src, commands[1].dst, commands[1].cmd, commands[1].att)
+    loop.close()
+
+
+def test_snapshot():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([True, False]), loop=loop)
+    assert 0 == network.snapshot.version
+    network._after_polled(0, _done(loop, True))
+    network.get_device(0).stop()
+    snapshot = network.snapshot
+    assert 1 == snapshot.version
+    assert 0 == snapshot.devices[0].logical_address
+    network.command_callback(">> 0f:82:10:00")
+    network.command_callback(">> 01:90:01")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert 3 == network.snapshot.version
+    assert 1 == network.snapshot.devices[0].power_status
+    assert 0x1000 == network.snapshot.active_source.asint
+    assert snapshot.devices[0].power_status == 0
+    network.command_callback(">> 01:90:01")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert 3 == network.snapshot.version
+    network._after_polled(0, _done(loop, False))
+    assert network.snapshot.devices[0] is None
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+
+class ImmediateDispatcher(CallbackDispatcher):
+    """Runs callbacks at once, like an idle executor thread could."""
+
+    def dispatch(self, key, callback, *args, coalesce=False):
+        callback(*args)
+
+
+def test_inferred_update_notified_once():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop,
+                          callback_dispatcher=ImmediateDispatcher())
+    device = HDMIDevice(4, network, loop=loop)
+    network._devices[4] = device
+    updates = []
+    device.set_update_callback(lambda d: updates.append(d.snapshot))
+    network.command_callback(">> 4f:84:10:00:04")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert 1 == len(updates)
+    assert 0x1000 == updates[0].physical_address.asint
+    assert updates[0] is device.snapshot
+    loop.close()
+
+
+def test_update_callback_sees_snapshot():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop,
+                          callback_dispatcher=ImmediateDispatcher())
+    device = HDMIDevice(4, network, loop=loop)
+    network._devices[4] = device
+    seen = []
+    device.set_update_callback(lambda d: seen.append(
+        network.snapshot.devices[4] is d.snapshot))
+    network.command_callback(">> 40:90:01")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert [True] == seen
+    loop.close()
+
+
+def _done(loop, result):
+    future = loop.create_future()
+    future.set_result(result)
+    return future
+
+
+def test_malformed_frames():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop)
+    device = HDMIDevice(4, network, loop=loop)
+    network._devices[4] = device
+    commands = []
+    network.set_command_callback(commands.append)
+    network.command_callback(">> 40:90")
+    network.command_callback(">> 40:90:01")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert ["40:90"] == [c.raw for c in commands]
+    assert 1 == device.power_status
+    loop.close()
+
+
+def test_send_keys():
+    loop = asyncio.new_event_loop()
+    adapter = KeyAdapter([])
+    network = HDMINetwork(adapter, loop=loop)
+    start = loop.time()
+    result = loop.run_until_complete(network.async_send_keys(
+        4, [0x34, (0x02, 0.5), 0x00], gap=0.05))
+    assert result is True
+    assert ["24:44:34", "24:45", "24:44:02", "24:44:02", "24:45",
+            "24:44:00", "24:45"] == [raw for when, raw in adapter.sent]
+    times = [when - start for when, raw in adapter.sent]
+    for expected, actual in zip([0, 0, .05, .45, .55, .6, .6], times):
+        assert abs(expected - actual) < 0.03
+    loop.close()
+
+
+def test_send_keys_cancelled():
+    loop = asyncio.new_event_loop()
+    adapter = KeyAdapter([])
+    network = HDMINetwork(adapter, loop=loop)
+    task = loop.create_task(network.async_send_keys(4, [(0x41, 1), 0x42]))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    task.cancel()
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert ["24:44:41", "24:45"] == [raw for when, raw in adapter.sent]
+    loop.close()
+
+
+def test_set_volume():
+    loop = asyncio.new_event_loop()
+    adapter = VolumeAdapter(3, 21)
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    device = HDMIDevice(5, network, loop=loop)
+    network._devices[5] = device
+    assert loop.run_until_complete(device.async_set_volume(50))
+    assert 51 == device.volume_status
+    requests = [raw for when, raw in adapter.sent].count("25:71")
+    assert 3 == requests
+    assert loop.run_until_complete(device.async_set_volume(30))
+    assert 30 == device.volume_status
+    assert 5 == [raw for when, raw in adapter.sent].count("25:71")
+    loop.close()
+
+
+def test_set_volume_timeout():
+    loop = asyncio.new_event_loop()
+    adapter = VolumeAdapter(1, 0)
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    device = HDMIDevice(5, network, loop=loop)
+    network._devices[5] = device
+    start = loop.time()
+    # first round alone would send 50 presses 0.1 s apart
+    assert not loop.run_until_complete(device.async_set_volume(100, 0.5))
+    assert loop.time() - start < 0.7
+    # key held when cancelled was released
+    assert "25:45" == adapter.sent[-1][1]
+    loop.close()
+
+
+def test_status_reporting(caplog):
+    loop = asyncio.new_event_loop()
+    adapter = DeckAdapter(reporting={4})
+    adapter._reply_times = RoundTripTimes(default=0.05, minimum=0.05)
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context))
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    for address in (4, 8):
+        network._devices[address] = HDMIDevice(address, network, loop=loop)
+    player, refusing = network.get_device(4), network.get_device(8)
+
+    assert loop.run_until_complete(player._async_refresh(0x1a))
+    assert not loop.run_until_complete(refusing._async_refresh(0x1a))
+    assert ["24:1a:01", "28:1a:01"] == [raw for when, raw in adapter.sent]
+    adapter.sent.clear()
+    loop.run_until_complete(player._async_refresh(0x1a))
+    loop.run_until_complete(refusing._async_refresh(0x1a))
+    assert ["28:1a:03"] == [raw for when, raw in adapter.sent]
+
+    # reports pushed by the device update its status
+    network.command_callback(CecCommand("42:1b:11"))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert 0x11 == player.status
+
+    # devices drop subscriptions in standby
+    adapter.sent.clear()
+    network.command_callback(CecCommand("4f:90:01"))
+    network.command_callback(CecCommand("4f:90:00"))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert ["24:1a:01"] == [raw for when, raw in adapter.sent]
+    assert player._reporting
+    # errors of frame processing are logged, others reach the loop
+    assert [] == errors
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    loop.close()
+
+
+def test_power_inference():
+    loop = asyncio.new_event_loop()
+    adapter = VolumeAdapter(1, 20)
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    for address in (0, 4):
+        network._devices[address] = HDMIDevice(address, network, loop=loop)
+    tv, player = network.get_device(0), network.get_device(4)
+    tv._physical_address = PhysicalAddress("0.0.0.0")
+    player._physical_address = PhysicalAddress("1.0.0.0")
+    assert not player.power_certain
+
+    network.command_callback(CecCommand("4f:82:10:00"))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert 0 == player.power_status
+    assert player.power_certain
+    assert player.is_active_source
+    assert not tv.is_active_source
+
+    network.command_callback(CecCommand("0f:36"))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert 1 == tv.power_status
+    assert 1 == player.power_status
+    assert network.active_source_address is None
+    assert [] == adapter.sent
+
+    # stream path only implies the player turns on, so it's verified
+    network.command_callback(CecCommand("0f:86:10:00"))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert 0 == tv.power_status
+    assert "24:8f" in [raw for when, raw in adapter.sent]
+    assert 1 == player.power_status
+    assert 1.0 == round(player.power_confidence, 3)
+
+    # weaker evidence doesn't override more certain status
+    adapter.sent.clear()
+    network.command_callback(CecCommand("4f:84:10:00:04"))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert 1 == player.power_status
+    assert loop.run_until_complete(player._async_refresh(0x8f))
+    assert [] == adapter.sent
+    loop.close()
+
+
+def test_feature_abort():
+    loop = asyncio.new_event_loop()
+    adapter = AbortAdapter({0: 0x00, 4: 0x03})
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    for address in (0, 4):
+        network._devices[address] = HDMIDevice(address, network, loop=loop)
+    tv, player = network.get_device(0), network.get_device(4)
+
+    start = loop.time()
+    assert not loop.run_until_complete(tv._async_refresh(0x1a))
+    assert not loop.run_until_complete(player._async_refresh(0x1a))
+    assert loop.time() - start < 1
+    assert (0x1a,) == tv.unsupported_opcodes
+    assert not tv.supports(0x1a)
+    # other reasons don't mean the opcode is unsupported
+    assert player.supports(0x1a)
+    assert player._polled_only
+
+    adapter.sent.clear()
+    assert loop.run_until_complete(
+        network.async_request(CecCommand(0x1a, 0, att=[0x03]))) is None
+    assert [] == adapter.sent
+    assert not tv._applicable(0x1a)
+
+    # abort of another request doesn't end ours
+    request = loop.create_task(network.async_request(CecCommand(0x71, 5)))
+    loop.run_until_complete(asyncio.sleep(0))
+    network.command_callback(CecCommand(0x00, 3, 5, [0x8c, 0x04]))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert not request.done()
+    network.command_callback(CecCommand(0x7a, 2, 5, [0x20]))
+    assert 0x20 == loop.run_until_complete(request).att[0]
+
+    tv._unsupported[0x1a] -= UNSUPPORTED_RECHECK
+    assert tv.supports(0x1a)
+    assert () == tv.unsupported_opcodes
+    loop.close()
+
+
+def test_command_callback_burst():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop)
+    received = []
+    network.set_command_callback(received.append)
+    for i in range(100):
+        network.command_callback(CecCommand(0x89, 0, 4, [i]))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert list(range(100)) == [c.att[0] for c in received]
+    loop.close()
+
+
+def test_frame_callback_error():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop)
+    received = []
+
+    def frame_callback(command):
+        received.append(command.raw)
+        if len(received) == 1:
+            raise RuntimeError
+
+    network.set_frame_callback(frame_callback)
+    for i in range(3):
+        network.command_callback(">> 40:90:%02x" % i)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert ["40:90:00", "40:90:01", "40:90:02"] == received
+    assert not network._inbound
+    loop.close()
+
+
+def test_stop_during_init():
+    loop = asyncio.new_event_loop()
+    adapter = MockAdapter([])
+    adapter.init = lambda callback=None: loop.create_future()
+    network = HDMINetwork(adapter, loop=loop)
+    task = loop.create_task(network.async_init())
+    loop.run_until_complete(asyncio.sleep(0))
+    network._running = False
+    loop.run_until_complete(asyncio.wait_for(task, 2))
+    assert network.init_time is None
+    loop.close()
+
+
+def test_apply_scene():
+    loop = asyncio.new_event_loop()
+    adapter = VolumeAdapter(1, 20)
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    for address in (0, 4, 5):
+        network._devices[address] = HDMIDevice(address, network, loop=loop)
+    network.get_device(4)._physical_address = PhysicalAddress("1.1.0.0")
+    scene = {0: {STATE_POWER: True},
+             5: {STATE_POWER: True, STATE_VOLUME: 22}}
+    assert loop.run_until_complete(
+        network.async_apply_scene(scene, active_source=4))
+    sent = [raw for when, raw in adapter.sent]
+    assert {"20:44:6d", "25:44:6d", "20:8f", "25:8f", "2f:82:11:00",
+            "2f:86:11:00"}.issubset(sent)
+    assert 22 == network.get_device(5).volume_status
+    assert 0x1100 == network.active_source_address.asint
+    adapter.sent.clear()
+    assert loop.run_until_complete(
+        network.async_apply_scene(scene, active_source=4))
+    assert [] == adapter.sent
+    loop.close()
+
+
+class KeyAdapter(MockAdapter):
     def __init__(self, data):
-        self._data = data
-        self._command_callback = None
-        super().__init__()
+        super().__init__(data)
+        self.sent = []
 
-    def shutdown(self):
-        pass
+    def transmit(self, command):
+        self.sent.append((self._loop.time(), command.raw))
+        ack = self._loop.create_future()
+        ack.set_result(True)
+        return ack
 
-    def init(self, callback: callable = None):
-        f = asyncio.Future()
-        f.set_result(True)
-        self._initialized = True
-        return f
 
-    def power_on_devices(self):
-        pass
+class DeckAdapter(KeyAdapter):
+    def __init__(self, reporting):
+        super().__init__([])
+        self.reporting = reporting
 
-    def standby_devices(self):
-        pass
+    def transmit(self, command):
+        if command.cmd == CMD_DECK_STATUS[0] and \
+                command.dst in self.reporting:
+            self._loop.call_later(0.01, self._command_callback, CecCommand(
+                CMD_DECK_STATUS[1], command.src, command.dst, [0x1a]))
+        return super().transmit(command)
 
-    def set_command_callback(self, callback):
-        self._command_callback = callback
 
-    def poll_device(self, i):
-        f = asyncio.Future()
-        f.set_result(self._data[i])
-        return f
+class AbortAdapter(KeyAdapter):
+    def __init__(self, reasons):
+        super().__init__([])
+        self.reasons = reasons
+
+    def transmit(self, command):
+        if command.dst in self.reasons:
+            self._loop.call_later(0.01, self._command_callback, CecCommand(
+                0x00, command.src, command.dst,
+                [command.cmd, self.reasons[command.dst]]))
+        return super().transmit(command)
+
+
+class VolumeAdapter(KeyAdapter):
+    def __init__(self, step, volume):
+        super().__init__([])
+        self.step = step
+        self.volume = volume
+        self.power = dict()
 
     def transmit(self, command):
-        cmd = None
-        att = None
         if command.cmd == CMD_POWER_STATUS[0]:
-            cmd = CMD_POWER_STATUS[1]
-            att = [2]
-        elif command.cmd == CMD_OSD_NAME[0]:
-            cmd = CMD_OSD_NAME[1]
-            att = (ord(i) for i in ("Test%d" % command.dst))
-        elif command.cmd == CMD_VENDOR[0]:
-            cmd = CMD_VENDOR[1]
-            att = [0x00, 0x09, 0xB0]
-        elif command.cmd == CMD_PHYSICAL_ADDRESS[0]:
-            cmd = CMD_PHYSICAL_ADDRESS[1]
-            att = [0x09, 0xB0, 0x02]
-        elif command.cmd == CMD_DECK_STATUS[0]:
-            cmd = CMD_DECK_STATUS[1]
-            att = [0x09]
+            self._loop.call_later(0.01, self._command_callback, CecCommand(
+                CMD_POWER_STATUS[1], command.src, command.dst,
+                [self.power.get(command.dst, 1)]))
+        elif command.cmd == 0x44 and command.att[0] == 0x6d:
+            self.power[command.dst] = 2
         elif command.cmd == CMD_AUDIO_STATUS[0]:
-            cmd = CMD_AUDIO_STATUS[1]
-            att = [0x65]
-        response = CecCommand(cmd, src=command.dst, dst=command.src, att=att)
-        self._command_callback(">> " + response.raw)
-
-    def get_logical_address(self):
-        return 2
+            self._loop.call_later(0.01, self._command_callback, CecCommand(
+                CMD_AUDIO_STATUS[1], command.src, command.dst, [self.volume]))
+        elif command.cmd == 0x44:
+            self.volume += self.step if command.att[0] == 0x41 else -self.step
+        return super().transmit(command)
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = {"multiprocessing", "cec", "pycec.cec"}
+
+
+@pytest.mark.parametrize("module", ["pycec", "pycec.network", "pycec.tcp",
+                                    "pycec.__main__"])
+def test_deferred_imports(module):
+    loaded = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, %s; print(' '.join(sys.modules))" % module],
+        stdout=subprocess.PIPE, universal_newlines=True, check=True,
+        cwd=ROOT).stdout.split()
+    assert not DEFERRED.intersection(loaded)
@@ -0,0 +1,29 @@
+from pycec.commands import CecCommand
+from pycec.const import POWER_ON, POWER_OFF
+from pycec.inference import CONFIDENCE_ANNOUNCED, CONFIDENCE_IMPLIED, \
+    POWER_HALF_LIFE, PowerInference, decayed, infer_power
+
+
+def test_infer_power():
+    assert (PowerInference(15, None, POWER_OFF, CONFIDENCE_ANNOUNCED),) == \
+        infer_power(CecCommand("0f:36"))
+    assert (PowerInference(4, None, POWER_OFF, CONFIDENCE_ANNOUNCED),) == \
+        infer_power(CecCommand("04:36"))
+    assert (PowerInference(4, None, POWER_ON, CONFIDENCE_ANNOUNCED),) == \
+        infer_power(CecCommand("4f:82:10:00"))
+    assert (PowerInference(0, None, POWER_ON, CONFIDENCE_ANNOUNCED),
+            PowerInference(None, 0x2100, POWER_ON, CONFIDENCE_IMPLIED)) == \
+        infer_power(CecCommand("0f:86:21:00"))
+    assert (PowerInference(0, None, POWER_ON, CONFIDENCE_ANNOUNCED),
+            PowerInference(None, 0x2000, POWER_ON, CONFIDENCE_IMPLIED)) == \
+        infer_power(CecCommand("0f:80:10:00:20:00"))
+    assert (PowerInference(0, None, POWER_ON, CONFIDENCE_IMPLIED),) == \
+        infer_power(CecCommand("40:04"))
+    assert () == infer_power(CecCommand("40:90:00"))
+    assert () == infer_power(CecCommand("40"))
+
+
+def test_decayed():
+    assert 1.0 == decayed(1.0, 0)
+    assert 0.5 == decayed(1.0, POWER_HALF_LIFE)
+    assert 0.25 == decayed(1.0, 2 * POWER_HALF_LIFE)
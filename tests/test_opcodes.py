@@ -0,0 +1,33 @@
+from pycec.commands import CecCommand
+from pycec.const import CMD_POWER_STATUS, CMD_OSD_NAME
+from pycec.opcodes import OPCODES, opcode_name, reply_opcode, validate
+
+
+def test_table():
+    assert 0x100 == len(OPCODES)
+    assert all(info is None or OPCODES.index(info) == info.opcode
+               for info in OPCODES)
+    assert "REPORT_POWER_STATUS" == opcode_name(0x90)
+    assert "0x01" == opcode_name(0x01)
+    assert "POLL" == opcode_name(None)
+
+
+def test_reply():
+    assert CMD_POWER_STATUS[1] == reply_opcode(CMD_POWER_STATUS[0])
+    assert CMD_OSD_NAME[1] == reply_opcode(CMD_OSD_NAME[0])
+    assert reply_opcode(0x82) is None
+    assert reply_opcode(0x01) is None
+    assert reply_opcode(None) is None
+
+
+def test_validate():
+    assert validate(CecCommand("40:90:00")) is None
+    assert validate(CecCommand("4f:90:00")) is None
+    assert validate(CecCommand("4f:82:10:00")) is None
+    assert validate(CecCommand("40:01:02")) is None
+    assert validate(CecCommand("40")) is None
+    assert validate(CecCommand("40:90")) is not None
+    assert validate(CecCommand("40:90:00:00")) is not None
+    assert validate(CecCommand("40:82:10:00")) is not None
+    assert validate(CecCommand("40:82:10:00"), addressing=False) is None
+    assert validate(CecCommand("4f:8f")) is not None
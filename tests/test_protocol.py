@@ -0,0 +1,74 @@
+from pycec.commands import CecCommand
+from pycec.protocol import (
+    BinaryCodec,
+    TextCodec,
+    HELLO_BINARY,
+    MSG_ACK,
+    MSG_CONTROL,
+    MSG_FRAME,
+    MSG_POLL_REQUEST,
+    MSG_POLL_RESULT,
+    next_seq,
+)
+
+
+def test_text_decode():
+    codec = TextCodec(server=True)
+    codec.feed(b"10:04\r\nf4\r")
+    messages = list(codec.decode())
+    assert [MSG_FRAME, MSG_POLL_REQUEST] == [m.kind for m in messages]
+    assert "10:04" == messages[0].command.raw
+    assert 4 == messages[1].address
+    codec.feed(b"\n!" + HELLO_BINARY.encode() + b"\r\n\x04")
+    messages = list(codec.decode())
+    assert 1 == len(messages)
+    assert MSG_CONTROL == messages[0].kind
+    assert HELLO_BINARY == messages[0].text
+    assert b"\x04" == codec.take_buffer()
+
+
+def test_text_poll_result():
+    codec = TextCodec()
+    assert b"41\r\n" == codec.encode_poll_result(4, True, 1)
+    assert b"" == codec.encode_poll_result(4, False, 1)
+    codec.feed(b"41\r\n")
+    message = next(codec.decode())
+    assert MSG_POLL_RESULT == message.kind
+    assert 4 == message.address
+    assert message.result
+
+
+def test_binary_round_trip():
+    codec = BinaryCodec()
+    data = codec.encode_frame(CecCommand("1f:82:10:00"), 7)
+    assert b"\x07\x01\x00\x07\x1f\x82\x10\x00" == data
+    data += codec.encode_poll_request(4, 8)
+    data += codec.encode_poll_result(4, False, 1, 8)
+    data += codec.encode_ack(7)
+    data += codec.encode_control("SNAPSHOT")
+    codec.feed(data[:5])
+    assert [] == list(codec.decode())
+    codec.feed(data[5:])
+    messages = list(codec.decode())
+    assert [MSG_FRAME, MSG_POLL_REQUEST, MSG_POLL_RESULT, MSG_ACK,
+            MSG_CONTROL] == [m.kind for m in messages]
+    assert "1f:82:10:00" == messages[0].command.raw
+    assert 7 == messages[0].seq
+    assert (4, 8) == (messages[1].address, messages[1].seq)
+    assert messages[2].result is False
+    assert 0 == messages[3].status
+    assert "SNAPSHOT" == messages[4].text
+
+
+def test_binary_control_truncated():
+    codec = BinaryCodec()
+    data = codec.encode_control("x" * 251 + "\u00e9" * 2)
+    assert 0xfe == data[0]
+    codec.feed(data)
+    assert "x" * 251 == next(codec.decode()).text
+
+
+def test_next_seq():
+    assert 1 == next_seq(0)
+    assert 2 == next_seq(1)
+    assert 1 == next_seq(0xffff)
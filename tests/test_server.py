@@ -0,0 +1,305 @@
+import asyncio
+
+import pytest
+
+from pycec.commands import CecCommand
+from pycec.network import HDMIDevice, HDMINetwork, _UPDATE_INDEX
+from pycec.protocol import BinaryCodec, MSG_ACK, ACK_OK, ACK_FAILED
+from pycec.server import CecServer, FrameFilter, POLICY_DISCONNECT
+from pycec.tcp import TcpAdapter
+from tests.mocks import MockTransport
+
+
+def _connect(server):
+    protocol = server.create_protocol()
+    transport = MockTransport()
+    protocol.connection_made(transport)
+    return protocol, transport
+
+
+def test_fan_out():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop)
+    first, first_transport = _connect(server)
+    second, second_transport = _connect(server)
+    server.send_command(CecCommand("4f:82:10:00"))
+    server.send_command(CecCommand("40:90:00"))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"4f:82:10:00\r\n40:90:00\r\n" == first_transport.data
+    assert first_transport.data == second_transport.data
+    assert 2 == first.stats.sent
+    loop.close()
+
+
+def test_slow_client_drop():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop, queue_size=2)
+    client, transport = _connect(server)
+    client.pause_writing()
+    for i in range(4):
+        server.send_command(CecCommand(0x90, 0, 4, [i]))
+    assert 2 == client.stats.dropped
+    client.resume_writing()
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"40:90:02\r\n40:90:03\r\n" == transport.data
+    assert 1 == client.stats.pauses
+    loop.close()
+
+
+def test_slow_client_disconnect():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop, queue_size=2,
+                       slow_client_policy=POLICY_DISCONNECT)
+    client, transport = _connect(server)
+    client.pause_writing()
+    for i in range(3):
+        server.send_command(CecCommand(0x90, 0, 4, [i]))
+    assert transport.aborted
+    loop.close()
+
+
+def test_filter_parse():
+    f = FrameFilter.parse("src=0,4-5 op=8f-90 changes")
+    assert 0b110001 == f.src_mask
+    assert 0xffff == f.dst_mask
+    assert {0x8f, 0x90} == f.opcodes
+    assert f.changes_only
+    assert FrameFilter.parse("op=*").opcodes is None
+    with pytest.raises(ValueError):
+        FrameFilter.parse("src=10")
+    with pytest.raises(ValueError):
+        FrameFilter.parse("foo=1")
+
+
+def test_filtered_routing():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop)
+    power, power_transport = _connect(server)
+    source, source_transport = _connect(server)
+    everything, everything_transport = _connect(server)
+    power.data_received(b"!FILTER src=0-e op=90 changes\r\n")
+    source.data_received(b"!FILTER op=82\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    power_transport.data = source_transport.data = b""
+    for raw in ("40:90:00", "40:90:00", "4f:82:10:00", "40:90:01"):
+        server.send_command(CecCommand(raw))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"40:90:00\r\n40:90:01\r\n" == power_transport.data
+    assert b"4f:82:10:00\r\n" == source_transport.data
+    assert 4 == everything.stats.sent
+    source.data_received(b"!FILTER CLEAR\r\n!FILTER src=x\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"!FILTER OK\r\n!FILTER ERROR" in source_transport.data
+    assert source in server._unfiltered
+    loop.close()
+
+
+def test_long_control_argument():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop)
+    client, transport = _connect(server)
+    client.data_received(b"!BINARY 1\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    transport.data = b""
+    codec = BinaryCodec()
+    client.data_received(codec.encode_control("FILTER " + "y" * 245) +
+                         codec.encode_control("SNAPSHOT " + "z" * 243))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert not transport.aborted
+    codec.feed(transport.data)
+    replies = [m.text for m in codec.decode()]
+    assert 2 == len(replies)
+    assert all(len(r) < 80 and " ERROR " in r for r in replies)
+    loop.close()
+
+
+def test_changes_per_client():
+    loop = asyncio.new_event_loop()
+    server = CecServer(None, loop)
+    early, early_transport = _connect(server)
+    early.data_received(b"!FILTER op=90 changes\r\n")
+    server.send_command(CecCommand("40:90:00"))
+    # frame seen while nobody filters on the opcode
+    server.send_command(CecCommand("40:87:00:09:b0"))
+    late, late_transport = _connect(server)
+    late.data_received(b"!FILTER op=90,87 changes\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    early_transport.data = late_transport.data = b""
+    for raw in ("40:90:00", "40:87:00:09:b0", "40:87:00:09:b0"):
+        server.send_command(CecCommand(raw))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"" == early_transport.data
+    assert b"40:90:00\r\n40:87:00:09:b0\r\n" == late_transport.data
+    loop.close()
+
+
+class MockPollAdapter:
+    def __init__(self, loop):
+        self._loop = loop
+        self.polls = dict()
+
+    def poll_device(self, device):
+        self.polls[device] = self._loop.create_future()
+        return self.polls[device]
+
+    def get_logical_address(self):
+        return 1
+
+
+class MockNetwork:
+    def __init__(self, devices, adapter=None):
+        self._devices = {d.logical_address: d for d in devices}
+        self._adapter = adapter
+        self.sent = []
+
+    @property
+    def devices(self):
+        return tuple(self._devices.values())
+
+    def get_device(self, i):
+        return self._devices.get(i)
+
+    async def async_send_command(self, command):
+        self.sent.append(command.raw)
+        return command.dst != 3
+
+
+def test_cached_reply():
+    loop = asyncio.new_event_loop()
+    device = HDMIDevice(4)
+    network = MockNetwork([device])
+    server = CecServer(network, loop, max_age=10)
+    client, transport = _connect(server)
+    client.data_received(b"14:8f\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert ["14:8f"] == network.sent
+    device.update_callback(CecCommand("41:90:01"))
+    device.update_callback(CecCommand("4f:84:20:00:04"))
+    client.data_received(b"14:8f\r\n14:83\r\n14:46\r\n")
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert b"41:90:01\r\n41:84:20:00:04\r\n" == transport.data
+    assert ["14:8f", "14:46"] == network.sent
+    # only one-off deck status requests are answered from cache
+    device.update_callback(CecCommand("4f:1b:11"))
+    client.data_received(b"14:1a:03\r\n14:1a:01\r\n14:1a:02\r\n")
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert transport.data.endswith(b"\r\n41:1b:11\r\n")
+    assert ["14:8f", "14:46", "14:1a:01", "14:1a:02"] == network.sent
+    device._update_times[_UPDATE_INDEX[0x8f]] -= 11
+    assert server.cached_reply(CecCommand("14:8f")) is None
+    loop.close()
+
+
+def test_single_flight_poll():
+    loop = asyncio.new_event_loop()
+    adapter = MockPollAdapter(loop)
+    server = CecServer(MockNetwork([], adapter), loop, poll_reuse=10)
+    first, first_transport = _connect(server)
+    second, second_transport = _connect(server)
+    listener, listener_transport = _connect(server)
+    first.data_received(b"f4\r\n")
+    second.data_received(b"f4\r\nf3\r\n")
+    assert {3, 4} == set(adapter.polls)
+    adapter.polls.pop(4).set_result(True)
+    adapter.polls.pop(3).set_result(False)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"41\r\n" == first_transport.data
+    assert b"41\r\n" == second_transport.data
+    assert b"41\r\n" == listener_transport.data
+    listener.data_received(b"f4\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert not adapter.polls
+    assert b"41\r\n41\r\n" == listener_transport.data
+    loop.close()
+
+
+def test_scan_shares_polls():
+    loop = asyncio.new_event_loop()
+    adapter = MockPollAdapter(loop)
+    server = CecServer(MockNetwork([], adapter), loop, poll_reuse=10)
+    client, transport = _connect(server)
+    scan = server.poll_device(4)
+    client.data_received(b"f4\r\n")
+    assert scan is adapter.polls[4]
+    adapter.polls.pop(4).set_result(True)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert b"41\r\n" == transport.data
+    # scan joins the client's poll
+    client.data_received(b"f3\r\n")
+    scan = server.poll_device(3)
+    adapter.polls.pop(3).set_result(False)
+    loop.run_until_complete(asyncio.sleep(0))
+    # recent results are reused by scans and clients alike
+    assert loop.run_until_complete(server.poll_device(4))
+    client.data_received(b"f4\r\n")
+    assert not adapter.polls
+    assert not scan.result()
+    loop.close()
+
+
+def test_snapshot():
+    loop = asyncio.new_event_loop()
+    device = HDMIDevice(4)
+    device.update_callback(CecCommand("41:90:01"))
+    server = CecServer(MockNetwork([device], MockPollAdapter(loop)), loop,
+                       history_size=2)
+    for raw in ("4f:82:10:00", "0f:36", "4f:86:10:00"):
+        server.send_command(CecCommand(raw))
+    client, transport = _connect(server)
+    client.data_received(b"!SNAPSHOT\r\n")
+    loop.run_until_complete(asyncio.sleep(0))
+    assert (b"0f:36\r\n4f:86:10:00\r\n41\r\n4f:90:01\r\n"
+            b"!SNAPSHOT END\r\n") == transport.data
+    loop.close()
+
+
+def test_binary_acknowledgement():
+    loop = asyncio.new_event_loop()
+    server = CecServer(MockNetwork([]), loop)
+    client, transport = _connect(server)
+    client.data_received(b"!BINARY 1\r\n")
+    codec = BinaryCodec()
+    client.data_received(codec.encode_frame(CecCommand("14:8f"), 5) +
+                         codec.encode_frame(CecCommand("13:8f"), 6))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    codec.feed(transport.data[len(b"!BINARY 1\r\n"):])
+    acks = [(m.seq, m.status) for m in codec.decode() if m.kind == MSG_ACK]
+    assert [(5, ACK_OK), (6, ACK_FAILED)] == acks
+    loop.close()
+
+
+class AbortNetwork(MockNetwork):
+    """Network of a device aborting every request sent through the server,
+    addressed to the server's logical address."""
+
+    def __init__(self, adapter):
+        super().__init__([], adapter)
+        self.server = None
+
+    async def async_send_command(self, command):
+        await super().async_send_command(command)
+        self.server.send_command(CecCommand(
+            0x00, self._adapter.get_logical_address(), command.dst,
+            [command.cmd, 0x00]))
+        return True
+
+
+def test_feature_abort_through_server():
+    loop = asyncio.new_event_loop()
+    bus = AbortNetwork(MockPollAdapter(loop))
+    server = bus.server = CecServer(bus, loop)
+    listener = loop.run_until_complete(loop.create_server(
+        server.create_protocol, "127.0.0.1", 0))
+    adapter = TcpAdapter("127.0.0.1", listener.sockets[0].getsockname()[1])
+    network = HDMINetwork(adapter, loop=loop)
+    adapter.set_command_callback(network.command_callback)
+    loop.run_until_complete(adapter.init())
+    loop.run_until_complete(asyncio.sleep(0.01))
+    start = loop.time()
+    assert loop.run_until_complete(
+        network.async_request(CecCommand(0x1a, 4, att=[0x03]))) is None
+    assert loop.time() - start < 1
+    assert ["f4:1a:03"] == bus.sent
+    adapter.shutdown()
+    listener.close()
+    loop.close()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from pycec.commands import CecCommand
+from pycec.network import HDMINetwork, HDMIDevice
+from pycec.subscription import CommandSubscription, OVERFLOW_DROP_NEWEST, \
+    OVERFLOW_BLOCK
+from tests.mocks import MockAdapter
+
+
+def test_filter_and_drop_oldest():
+    loop = asyncio.new_event_loop()
+    subscription = CommandSubscription(loop, lambda c: c.cmd == 0x90,
+                                       maxsize=2)
+    for raw in ("40:90:00", "4f:82:10:00", "40:90:01", "40:90:02"):
+        subscription.offer(CecCommand(raw))
+    assert 2 == len(subscription)
+    assert 1 == subscription.dropped
+    assert "40:90:01" == loop.run_until_complete(subscription.get()).raw
+    loop.close()
+
+
+def test_drop_newest():
+    loop = asyncio.new_event_loop()
+    subscription = CommandSubscription(loop, maxsize=1,
+                                       overflow=OVERFLOW_DROP_NEWEST)
+    subscription.offer(CecCommand("40:90:00"))
+    subscription.offer(CecCommand("40:90:01"))
+    assert 1 == subscription.dropped
+    assert "40:90:00" == loop.run_until_complete(subscription.get()).raw
+    with pytest.raises(ValueError):
+        CommandSubscription(loop, overflow="unknown")
+    loop.close()
+
+
+def test_network_commands():
+    loop = asyncio.new_event_loop()
+    network = HDMINetwork(MockAdapter([]), loop=loop)
+    received = []
+
+    async def consume():
+        async with network.commands(lambda c: c.src == 4) as commands:
+            async for command in commands:
+                received.append(command.raw)
+                if len(received) == 2:
+                    break
+
+    task = loop.create_task(consume())
+    loop.run_until_complete(asyncio.sleep(0))
+    for raw in ("40:90:00", "30:90:00", "4f:82:10:00", "40:90:01"):
+        network.command_callback(">> " + raw)
+    loop.run_until_complete(task)
+    assert ["40:90:00", "4f:82:10:00"] == received
+    assert [] == network._subscriptions
+    loop.close()
+
+
+def test_network_commands_block():
+    loop = asyncio.new_event_loop()
+    adapter = MockAdapter([])
+    network = HDMINetwork(adapter, loop=loop)
+    network._devices[4] = HDMIDevice(4, network, loop=loop)
+    commands = network.commands(maxsize=1, overflow=OVERFLOW_BLOCK)
+    filtered = network.commands(lambda c: c.src == 3, maxsize=1,
+                                overflow=OVERFLOW_BLOCK)
+    other = network.commands()
+    for i in range(3):
+        network.command_callback(">> 40:90:%02x" % i)
+    loop.run_until_complete(asyncio.sleep(0))
+    # slow consumer neither holds up the network nor other subscribers
+    assert 3 == len(other)
+    assert 2 == network.get_device(4).power_status
+    assert commands.blocking
+    assert not filtered.blocking
+    for i in range(3):
+        assert "40:90:%02x" % i == \
+            loop.run_until_complete(commands.get()).raw
+    assert not commands.blocking
+    assert 0 == commands.dropped
+    loop.close()
+
+
+def test_block_backlog():
+    loop = asyncio.new_event_loop()
+    subscription = CommandSubscription(loop, maxsize=1,
+                                       overflow=OVERFLOW_BLOCK, backlog=2)
+    for i in range(3):
+        subscription.offer(CecCommand("40:90:%02x" % i))
+    assert 2 == len(subscription)
+    assert 1 == subscription.dropped
+    loop.close()
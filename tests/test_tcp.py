@@ -0,0 +1,170 @@
+import asyncio
+
+from pycec.commands import CecCommand
+from pycec.protocol import Message, MSG_CONTROL, MSG_POLL_RESULT, HELLO_BINARY
+from pycec.network import CONNECTION_CONNECTED
+from pycec import tcp
+from pycec.tcp import TcpAdapter
+from tests.mocks import MockTransport
+
+
+def _connected(loop, **kwargs):
+    adapter = TcpAdapter("localhost", **kwargs)
+    adapter.set_event_loop(loop)
+    adapter.set_transport(MockTransport())
+    adapter._set_connection_state(CONNECTION_CONNECTED)
+    return adapter
+
+
+def test_snapshot_during_scan():
+    loop = asyncio.new_event_loop()
+    adapter = _connected(loop, snapshot=True)
+    adapter._receiving_snapshot = True
+    # scan polls device 4 while the snapshot is being received
+    scan = adapter.poll_device(4)
+    loop.run_until_complete(asyncio.sleep(0))
+    adapter._handle_message(Message(MSG_POLL_RESULT, address=4, result=True))
+    adapter._handle_message(Message(MSG_CONTROL, text="SNAPSHOT END"))
+    assert loop.run_until_complete(scan)
+    assert loop.run_until_complete(adapter.poll_device(4))
+    assert not loop.run_until_complete(adapter.poll_device(3))
+    # results are used only once
+    assert 4 not in adapter._snapshot_polls
+    assert 3 not in adapter._snapshot_polls
+    loop.close()
+
+
+def test_snapshot_expiry(monkeypatch):
+    monkeypatch.setattr(tcp, "SNAPSHOT_POLL_EXPIRY", 0)
+    loop = asyncio.new_event_loop()
+    adapter = _connected(loop, snapshot=True)
+    adapter._receiving_snapshot = True
+    adapter._handle_message(Message(MSG_POLL_RESULT, address=4, result=True))
+    adapter._handle_message(Message(MSG_CONTROL, text="SNAPSHOT END"))
+    assert 15 == len(adapter._snapshot_polls)
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert not adapter._snapshot_polls
+    loop.close()
+
+
+class _Server(asyncio.Protocol):
+    """Local server recording connections and data, optionally closing
+    connections right away like servers rejecting the client do."""
+
+    def __init__(self, record, close):
+        self._record = record
+        self._close = close
+
+    def connection_made(self, transport):
+        self._record.append(b"")
+        if self._close:
+            transport.close()
+
+    def data_received(self, data):
+        self._record[-1] += data
+
+
+def _serve(loop, close=False):
+    record = []
+    server = loop.run_until_complete(loop.create_server(
+        lambda: _Server(record, close), "127.0.0.1", 0))
+    return server, server.sockets[0].getsockname()[1], record
+
+
+def test_reconnect_backoff(monkeypatch):
+    monkeypatch.setattr(tcp, "CONNECTION_ATTEMPT_DELAY", 0.1)
+    loop = asyncio.new_event_loop()
+    server, port, record = _serve(loop, close=True)
+    adapter = TcpAdapter("127.0.0.1", port)
+    adapter.set_event_loop(loop)
+    loop.run_until_complete(adapter.init())
+    loop.run_until_complete(asyncio.sleep(1))
+    # delays of 0.05-0.1, 0.1-0.2, 0.2-0.4 and 0.4-0.8 s between connections
+    assert 3 <= len(record) <= 5
+    adapter.shutdown()
+    server.close()
+    loop.close()
+
+
+def test_stable_connection(monkeypatch):
+    monkeypatch.setattr(tcp, "STABLE_CONNECTION", 0.05)
+    loop = asyncio.new_event_loop()
+    server, port, record = _serve(loop)
+    adapter = TcpAdapter("127.0.0.1", port)
+    adapter.set_event_loop(loop)
+    loop.run_until_complete(adapter._async_connect())
+    # connections lost before this one
+    adapter._attempt = 4
+    loop.run_until_complete(asyncio.sleep(0.1))
+    assert 1 == adapter._attempt
+    adapter.shutdown()
+    server.close()
+    loop.close()
+
+
+def test_shutdown_on_closed_loop(monkeypatch):
+    monkeypatch.setattr(tcp, "CONNECTION_ATTEMPT_DELAY", 10)
+    loop = asyncio.new_event_loop()
+    server, port, record = _serve(loop, close=True)
+    adapter = TcpAdapter("127.0.0.1", port)
+    adapter.set_event_loop(loop)
+    loop.run_until_complete(adapter.init())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    # reconnecting, waiting for backoff
+    assert not adapter._connector.done()
+    server.close()
+    loop.close()
+    adapter.shutdown()
+
+
+def test_outbound_replay_and_expiry():
+    loop = asyncio.new_event_loop()
+    server, port, record = _serve(loop)
+    adapter = TcpAdapter("127.0.0.1", port, command_expiry=0.05)
+    adapter.set_event_loop(loop)
+    adapter.transmit(CecCommand("10:8f"))
+    loop.run_until_complete(asyncio.sleep(0.1))
+    adapter.transmit(CecCommand("10:46"))
+    loop.run_until_complete(adapter.init())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert [b"10:46\r\n"] == record
+    adapter.shutdown()
+    server.close()
+    loop.close()
+
+
+def test_negotiation_after_dropped_connection(monkeypatch):
+    monkeypatch.setattr(tcp, "NEGOTIATION_TIMEOUT", 0.05)
+    loop = asyncio.new_event_loop()
+    adapter = TcpAdapter("localhost", binary=True)
+    adapter.set_event_loop(loop)
+    adapter._connector = loop.create_future()
+    dropped = MockTransport()
+    adapter._connection_made(dropped)
+    adapter._connection_lost()
+    assert adapter._binary
+    transport = MockTransport()
+    adapter._connection_made(transport)
+    adapter._handle_message(Message(MSG_CONTROL, text=HELLO_BINARY))
+    loop.run_until_complete(asyncio.sleep(0.1))
+    # timer of the dropped connection does not close this one
+    assert not transport.closed
+    assert adapter._binary
+    adapter._connector.cancel()
+    adapter.shutdown()
+    loop.close()
+
+
+def test_negotiation_rejected(monkeypatch):
+    monkeypatch.setattr(tcp, "CONNECTION_ATTEMPT_DELAY", 0.01)
+    loop = asyncio.new_event_loop()
+    server, port, record = _serve(loop, close=True)
+    adapter = TcpAdapter("127.0.0.1", port, binary=True)
+    adapter.set_event_loop(loop)
+    loop.run_until_complete(adapter.init())
+    loop.run_until_complete(asyncio.sleep(0.2))
+    assert not adapter._binary
+    adapter.shutdown()
+    loop.run_until_complete(asyncio.sleep(0))
+    server.close()
+    loop.close()